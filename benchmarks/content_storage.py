@@ -0,0 +1,140 @@
+"""
+Measure stored row size and load time of site content, plain vs compressed.
+
+Usage (from the repository root, with the same .env as the bot):
+    python -m benchmarks.content_storage pages/                   # every *.html in the directory
+    python -m benchmarks.content_storage pages/ --rows 2000 --database-url postgresql://...
+
+Saved pages are turned into text and a BM25 index the same way the bot does it,
+then written into scratch tables (one per codec) of a temporary SQLite database
+or the given database. For each layout prints the average stored bytes per row
+and the median time to load one row by id: the whole row ("full") and only the
+small columns, as get_latest_url does with deferred content ("meta").
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import Column, Integer, MetaData, String, Table, Text, create_engine, func, select
+
+from benchmarks.html_extractors import load_corpus
+from config import RETRIEVAL_CHUNK_SIZE, RETRIEVAL_CHUNK_OVERLAP
+from database import CompressedText, resolve_compression
+from extractors import extract_text, resolve_backend
+from retrieval import build_index, dump_index
+
+
+def build_tables(metadata, codecs, level):
+    tables = {"plain": Table("bench_content_plain", metadata, *_columns(Text()))}
+    for codec in codecs:
+        tables[f"{codec}:{level}"] = Table(
+            f"bench_content_{codec}", metadata, *_columns(CompressedText(codec=codec, level=level))
+        )
+    return tables
+
+
+def _columns(content_type):
+    return [
+        Column("id", Integer, primary_key=True),
+        Column("url", String(512)),
+        Column("content_hash", String(64)),
+        Column("cleaned_content", content_type),
+        Column("content_index", content_type),
+    ]
+
+
+def load_dataset(paths):
+    backend = resolve_backend("auto")
+    dataset = []
+    for name, html in load_corpus(paths):
+        text = extract_text(html, backend)
+        if text:
+            index = dump_index(build_index(text, RETRIEVAL_CHUNK_SIZE, RETRIEVAL_CHUNK_OVERLAP))
+            dataset.append((name, text, index))
+    return dataset
+
+
+def stored_bytes(conn, table):
+    size = func.octet_length if conn.dialect.name == "postgresql" else func.length
+    query = select(func.avg(size(table.c.cleaned_content) + size(table.c.content_index)))
+    return float(conn.execute(query).scalar() or 0)
+
+
+def time_loads(conn, table, columns, rows, lookups):
+    timings = []
+    for i in range(lookups):
+        row_id = (i * 7919) % rows + 1
+        started = time.perf_counter()
+        conn.execute(select(*columns).where(table.c.id == row_id)).one()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", help="HTML files or directories with saved pages")
+    parser.add_argument("--rows", type=int, default=1000, help="rows per table, pages are repeated")
+    parser.add_argument("--lookups", type=int, default=500, help="timed loads per layout")
+    parser.add_argument("--level", type=int, default=3, help="compression level")
+    parser.add_argument("--database-url", help="database for the scratch tables (default: temporary SQLite)")
+    args = parser.parse_args()
+
+    dataset = load_dataset(args.paths)
+    if not dataset:
+        parser.error("no HTML files with text found")
+
+    codecs = sorted({"zlib", resolve_compression("zstd")})
+    scratch = None
+    if args.database_url:
+        url = args.database_url
+    else:
+        scratch = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+        url = f"sqlite:///{scratch.name}"
+
+    engine = create_engine(url)
+    metadata = MetaData()
+    tables = build_tables(metadata, codecs, args.level)
+    metadata.drop_all(engine)
+    metadata.create_all(engine)
+    try:
+        print(f"{len(dataset)} pages, {args.rows} rows per table, {engine.dialect.name}\n")
+        print(f"{'layout':10} {'row bytes':>10} {'ratio':>6} {'write ms':>9} {'full ms':>8} {'meta ms':>8}")
+        plain_bytes = None
+        for layout, table in tables.items():
+            rows = [
+                {
+                    "id": i + 1,
+                    "url": f"https://{name}/{i}",
+                    "content_hash": f"{i:064x}",
+                    "cleaned_content": text,
+                    "content_index": index,
+                }
+                for i, (name, text, index) in ((i, dataset[i % len(dataset)]) for i in range(args.rows))
+            ]
+            with engine.begin() as conn:
+                started = time.perf_counter()
+                conn.execute(table.insert(), rows)
+                write_ms = (time.perf_counter() - started) * 1000
+
+            with engine.connect() as conn:
+                size = stored_bytes(conn, table)
+                plain_bytes = plain_bytes or size
+                full = time_loads(conn, table, [table], args.rows, args.lookups)
+                meta = time_loads(conn, table, [table.c.id, table.c.url, table.c.content_hash], args.rows, args.lookups)
+            print(
+                f"{layout:10} {size:>10.0f} {plain_bytes / size if size else 0:>5.1f}x "
+                f"{write_ms:>9.1f} {full * 1000:>8.3f} {meta * 1000:>8.3f}"
+            )
+    finally:
+        metadata.drop_all(engine)
+        engine.dispose()
+        if scratch is not None:
+            scratch.close()
+            os.unlink(scratch.name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Compare HTML extractor backends on a corpus of saved pages.
+
+Usage (from the repository root):
+    python -m benchmarks.html_extractors pages/            # every *.html in the directory
+    python -m benchmarks.html_extractors a.html b.html -n 20
+
+For each installed backend prints the median extraction time per page and how
+closely its output matches the reference bs4/html.parser output (word-level
+Jaccard similarity and length ratio).
+"""
+
+import argparse
+import glob
+import os
+import re
+import statistics
+import time
+
+from extractors import EXTRACTORS, available_backends, extract_text
+
+REFERENCE = "bs4"
+
+
+def load_corpus(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "*.html")) + glob.glob(os.path.join(path, "*.htm"))))
+        else:
+            files.append(path)
+
+    corpus = []
+    for file in files:
+        with open(file, encoding="utf-8", errors="replace") as f:
+            corpus.append((os.path.basename(file), f.read()))
+    return corpus
+
+
+def similarity(a: str, b: str) -> float:
+    words_a, words_b = set(re.findall(r"\w+", a.lower())), set(re.findall(r"\w+", b.lower()))
+    if not words_a and not words_b:
+        return 1.0
+    return len(words_a & words_b) / len(words_a | words_b)
+
+
+def time_backend(backend, html, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        text = extract_text(html, backend)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings), text
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", help="HTML files or directories with saved pages")
+    parser.add_argument("-n", "--repeat", type=int, default=5, help="runs per page and backend")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.paths)
+    if not corpus:
+        parser.error("no HTML files found")
+
+    backends = [name for name in EXTRACTORS if name in available_backends()]
+    total_bytes = sum(len(html.encode("utf-8")) for _, html in corpus)
+    print(f"{len(corpus)} pages, {total_bytes / 1024:.0f} KiB, backends: {', '.join(backends)}\n")
+
+    results = {name: {"time": [], "similarity": [], "length": []} for name in backends}
+    for _, html in corpus:
+        reference_time, reference = time_backend(REFERENCE, html, args.repeat)
+        for backend in backends:
+            if backend == REFERENCE:
+                elapsed, text = reference_time, reference
+            else:
+                elapsed, text = time_backend(backend, html, args.repeat)
+            results[backend]["time"].append(elapsed)
+            results[backend]["similarity"].append(similarity(reference, text))
+            results[backend]["length"].append(len(text) / len(reference) if reference else 1.0)
+
+    reference_total = sum(results[REFERENCE]["time"])
+    print(f"{'backend':12} {'total ms':>9} {'median ms':>10} {'speedup':>8} {'similarity':>11} {'length':>7}")
+    for backend in backends:
+        r = results[backend]
+        total = sum(r["time"])
+        print(
+            f"{backend:12} {total * 1000:>9.1f} {statistics.median(r['time']) * 1000:>10.2f} "
+            f"{reference_total / total if total else 0:>7.1f}x {statistics.mean(r['similarity']):>11.3f} "
+            f"{statistics.mean(r['length']):>7.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,429 @@
+"""
+Offline load test: run the bot (main.main) against local stand-ins for every
+outside service and measure throughput, end-to-end latency and peak memory.
+
+Usage (from the repository root; .env is not read, nothing leaves the machine):
+    python -m benchmarks.load_test                                   # 200 updates at 10/s from 20 users
+    python -m benchmarks.load_test -n 1000 --rate 50 --users 200 --llm-latency 1.5
+    STREAMING_ENABLED=1 python -m benchmarks.load_test --json baseline.json
+
+A child process serves three stand-ins on one local port:
+  - Telegram Bot API: getUpdates hands out synthetic messages arriving as a
+    Poisson process at --rate; sendMessage/editMessageText are acknowledged
+  - OpenAI chat completions (plain and streaming) answering after --llm-latency
+  - company websites http://siteN.bench.test, reached through HTTP_PROXY
+
+Each user first sends a site URL, then questions about it. Latency is measured
+from the moment an update becomes available in getUpdates until handle_update
+has finished, replies included. Bot settings not set by the harness (streaming,
+rate limits, caches, DATABASE_URL via --database-url...) are taken from the
+environment, so runs with different settings can be compared.
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import resource
+import socket
+import statistics
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+BOT_TOKEN = "123456:bench"
+SITE_DOMAIN = "bench.test"
+
+QUESTIONS = [
+    "Какие услуги вы оказываете?",
+    "Как с вами связаться?",
+    "Сколько стоят ваши услуги?",
+    "Где находится офис компании?",
+    "Сколько лет компания на рынке?",
+]
+
+ANSWER = (
+    "Компания занимается разработкой программного обеспечения и консалтингом. "
+    "Основные направления: веб-разработка, мобильные приложения, интеграция систем "
+    "и поддержка. Связаться можно по телефону или через форму на сайте. "
+) * 3
+
+
+@dataclass
+class Settings:
+    port: int
+    messages: int
+    rate: float
+    users: int
+    sites: int
+    page_kb: int
+    site_latency: float
+    llm_latency: float
+    llm_jitter: float
+    stream_chunks: int
+    seed: int
+
+
+# --- Stand-ins (child process) -------------------------------------------------
+
+
+class FakeServices:
+    """Telegram Bot API, OpenAI and website stand-ins behind one ASGI app"""
+
+    def __init__(self, settings: Settings):
+        self.settings = settings
+        self.random = random.Random(settings.seed)
+        self.updates: List[Dict[str, Any]] = []
+        self.arrivals: Dict[int, Any] = {}
+        self.calls: Dict[str, int] = {}
+        self.new_updates = asyncio.Event()
+        self.generator: Optional[asyncio.Task] = None
+        self.message_ids = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+
+        path = scope["path"]
+        if path.startswith("http://"):
+            # Запрос через HTTP_PROXY: путь в absolute-form, это один из сайтов
+            return await self.site(urlsplit(path), send)
+        if path.startswith(f"/bot{BOT_TOKEN}/"):
+            method = path.rsplit("/", 1)[1]
+            self.calls[method] = self.calls.get(method, 0) + 1
+            query = parse_qs(scope["query_string"].decode())
+            return await self.telegram(method, query, json.loads(body or b"{}"), send)
+        if path == "/v1/chat/completions":
+            self.calls["chat.completions"] = self.calls.get("chat.completions", 0) + 1
+            return await self.completion(json.loads(body), send)
+        if path == "/bench/state":
+            return await _json(send, {"arrivals": self.arrivals, "calls": self.calls})
+        await _json(send, {"ok": False}, status=404)
+
+    async def generate(self) -> None:
+        """Publish synthetic messages as a Poisson process"""
+        s = self.settings
+        started_users = set()
+        for update_id in range(1, s.messages + 1):
+            await asyncio.sleep(self.random.expovariate(s.rate))
+            user = self.random.randrange(s.users) + 1
+            if user in started_users:
+                kind, text = "question", self.random.choice(QUESTIONS)
+            else:
+                started_users.add(user)
+                kind, text = "site", f"http://site{user % s.sites + 1}.{SITE_DOMAIN}"
+            self.updates.append({
+                "update_id": update_id,
+                "message": {
+                    "message_id": update_id,
+                    "date": int(time.time()),
+                    "chat": {"id": user, "type": "private"},
+                    "from": {"id": user, "is_bot": False, "first_name": "Bench"},
+                    "text": text,
+                },
+            })
+            self.arrivals[update_id] = [time.time(), kind]
+            self.new_updates.set()
+
+    async def telegram(self, method: str, query: Dict[str, List[str]], data: Dict[str, Any], send) -> None:
+        if method == "getUpdates":
+            # Отсчет начинается с первого запроса бота - к этому моменту он запущен
+            if self.generator is None:
+                self.generator = asyncio.create_task(self.generate())
+            offset = int(query.get("offset", ["0"])[0])
+            limit = int(query.get("limit", ["100"])[0])
+            timeout = float(query.get("timeout", ["0"])[0])
+            self.updates = [u for u in self.updates if u["update_id"] >= offset]
+            if not self.updates:
+                self.new_updates.clear()
+                try:
+                    await asyncio.wait_for(self.new_updates.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            return await _json(send, {"ok": True, "result": self.updates[:limit]})
+        if method in ("sendMessage", "editMessageText"):
+            self.message_ids += 1
+            message_id = data.get("message_id") or self.message_ids
+            return await _json(send, {
+                "ok": True,
+                "result": {"message_id": message_id, "chat": {"id": data.get("chat_id")}, "text": data.get("text")},
+            })
+        if method == "getWebhookInfo":
+            return await _json(send, {"ok": True, "result": {"url": ""}})
+        await _json(send, {"ok": True, "result": True})
+
+    async def completion(self, request: Dict[str, Any], send) -> None:
+        s = self.settings
+        latency = max(0.0, s.llm_latency + self.random.uniform(-s.llm_jitter, s.llm_jitter))
+        prompt = " ".join(m.get("content", "") for m in request.get("messages", []))
+        usage = {
+            "prompt_tokens": len(prompt) // 4,
+            "completion_tokens": len(ANSWER) // 4,
+            "total_tokens": (len(prompt) + len(ANSWER)) // 4,
+        }
+        base = {"id": "chatcmpl-bench", "created": int(time.time()), "model": request.get("model", "bench")}
+
+        if not request.get("stream"):
+            await asyncio.sleep(latency)
+            return await _json(send, {
+                **base,
+                "object": "chat.completion",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": ANSWER}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"text/event-stream")],
+        })
+        step = len(ANSWER) // s.stream_chunks + 1
+        for i in range(0, len(ANSWER), step):
+            await asyncio.sleep(latency / s.stream_chunks)
+            chunk = {
+                **base,
+                "object": "chat.completion.chunk",
+                "choices": [{"index": 0, "delta": {"content": ANSWER[i:i + step]}, "finish_reason": None}],
+            }
+            await _event(send, chunk)
+        await _event(send, {**base, "object": "chat.completion.chunk", "choices": [], "usage": usage})
+        await send({"type": "http.response.body", "body": b"data: [DONE]\n\n"})
+
+    async def site(self, url, send) -> None:
+        if self.settings.site_latency:
+            await asyncio.sleep(self.settings.site_latency)
+        if url.path == "/robots.txt":
+            return await _respond(send, 404, b"", b"text/plain")
+        name = url.hostname.split(".")[0].capitalize()
+        paragraph = (
+            f"<p>{name} разрабатывает программное обеспечение для бизнеса, внедряет и поддерживает "
+            f"корпоративные системы. Офис {name} находится в Москве, телефон +7 495 000-00-00.</p>\n"
+        )
+        paragraphs = paragraph * max(1, self.settings.page_kb * 1024 // len(paragraph.encode()))
+        html = (
+            f"<html><head><title>{name}</title></head><body><h1>{name}</h1>"
+            f'<nav><a href="/about">О компании</a> <a href="/services">Услуги</a> '
+            f'<a href="/contacts">Контакты</a></nav>\n{paragraphs}</body></html>'
+        )
+        await _respond(send, 200, html.encode(), b"text/html; charset=utf-8")
+
+
+async def _respond(send, status: int, body: bytes, content_type: bytes) -> None:
+    await send({"type": "http.response.start", "status": status, "headers": [(b"content-type", content_type)]})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _json(send, payload: Any, status: int = 200) -> None:
+    await _respond(send, status, json.dumps(payload, ensure_ascii=False).encode(), b"application/json")
+
+
+async def _event(send, payload: Any) -> None:
+    data = f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode()
+    await send({"type": "http.response.body", "body": data, "more_body": True})
+
+
+def serve_fakes(settings: Settings) -> None:
+    import uvicorn
+
+    uvicorn.run(FakeServices(settings), host="127.0.0.1", port=settings.port, log_level="warning", lifespan="off")
+
+
+# --- Bot under test (this process) ---------------------------------------------
+
+
+def configure_environment(port: int, database_url: str) -> None:
+    """Point the bot at the stand-ins; must run before config is imported"""
+    local = f"http://127.0.0.1:{port}"
+    os.environ.update({
+        "SKIP_DOTENV": "1",
+        "TELEGRAM_BOT_TOKEN": BOT_TOKEN,
+        "TELEGRAM_API_URL": local,
+        "OPENAI_BASE_URL": f"{local}/v1",
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_ORGANIZATION": "bench",
+        "YANDEX_FOLDERID": "bench",
+        "YANDEX_API_KEY": "bench",
+        "DATABASE_URL": database_url,
+        "BOT_MODE": "polling",
+        # Сайты *.bench.test отдает тот же процесс, работая как HTTP-прокси
+        "HTTP_PROXY": local,
+        "HTTPS_PROXY": local,
+        "NO_PROXY": "127.0.0.1,localhost",
+    })
+    os.environ.setdefault("POLL_TIMEOUT", "5")
+    os.environ.setdefault("SHUTDOWN_TIMEOUT", "5")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_for_fakes(port: int, process: multiprocessing.Process, timeout: float = 15.0) -> None:
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(trust_env=False) as client:
+        while process.is_alive() and time.monotonic() < deadline:
+            try:
+                response = await client.get(f"http://127.0.0.1:{port}/bench/state")
+                if "arrivals" in response.json():
+                    return
+            except (httpx.TransportError, ValueError):
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"stand-in services did not start on port {port}")
+
+
+async def run_bot(settings: Settings, timeout: float) -> Dict[str, Any]:
+    """Run main.main until every synthetic update is handled or timeout expires"""
+    import httpx
+
+    import main
+
+    done: Dict[int, float] = {}
+    handle_update = main.handle_update
+
+    async def timed_handle_update(update: Dict[str, Any]) -> None:
+        await handle_update(update)
+        done[update["update_id"]] = time.time()
+
+    # main() передает диспетчеру handle_update из модуля при запуске
+    main.handle_update = timed_handle_update
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    bot = asyncio.create_task(main.main())
+    deadline = time.monotonic() + timeout
+    while len(done) < settings.messages and time.monotonic() < deadline and not bot.done():
+        await asyncio.sleep(0.1)
+
+    async with httpx.AsyncClient(trust_env=False) as client:
+        state = (await client.get(f"http://127.0.0.1:{settings.port}/bench/state")).json()
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    bot.cancel()
+    await asyncio.gather(bot, return_exceptions=True)
+    return {"done": done, "state": state, "rss_before_kb": rss_before, "peak_rss_kb": peak_rss}
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    if len(values) == 1:
+        return {"p50": values[0], "p95": values[0], "p99": values[0], "max": values[0]}
+    cuts = statistics.quantiles(values, n=100, method="inclusive")
+    return {"p50": cuts[49], "p95": cuts[94], "p99": cuts[98], "max": max(values)}
+
+
+def summarize(settings: Settings, result: Dict[str, Any]) -> Dict[str, Any]:
+    arrivals = {int(k): v for k, v in result["state"]["arrivals"].items()}
+    done = result["done"]
+    latencies: Dict[str, List[float]] = {"all": []}
+    for update_id, finished in done.items():
+        arrived, kind = arrivals[update_id]
+        latencies["all"].append(finished - arrived)
+        latencies.setdefault(kind, []).append(finished - arrived)
+
+    elapsed = max(done.values()) - min(a for a, _ in arrivals.values()) if done else 0.0
+    return {
+        "settings": asdict(settings),
+        "sent": len(arrivals),
+        "handled": len(done),
+        "elapsed_s": round(elapsed, 3),
+        "updates_per_s": round(len(done) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            kind: {k: round(v * 1000, 1) for k, v in percentiles(sorted(values)).items()}
+            for kind, values in latencies.items()
+        },
+        # ru_maxrss в килобайтах на Linux
+        "peak_rss_mib": round(result["peak_rss_kb"] / 1024, 1),
+        "startup_rss_mib": round(result["rss_before_kb"] / 1024, 1),
+        "calls": result["state"]["calls"],
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"\nupdates     {report['handled']}/{report['sent']} handled in {report['elapsed_s']:.1f}s")
+    print(f"throughput  {report['updates_per_s']:.2f} updates/s")
+    print(f"{'latency ms':11} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for kind, values in report["latency_ms"].items():
+        if values:
+            print(f"  {kind:9} {values['p50']:>8.1f} {values['p95']:>8.1f} {values['p99']:>8.1f} {values['max']:>8.1f}")
+    print(f"peak RSS    {report['peak_rss_mib']:.1f} MiB (at startup {report['startup_rss_mib']:.1f} MiB)")
+    print("calls       " + ", ".join(f"{k}={v}" for k, v in sorted(report["calls"].items())))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--messages", type=int, default=200, help="synthetic updates to send")
+    parser.add_argument("--rate", type=float, default=10.0, help="average updates per second")
+    parser.add_argument("--users", type=int, default=20, help="distinct chats")
+    parser.add_argument("--sites", type=int, default=10, help="distinct company sites")
+    parser.add_argument("--page-kb", type=int, default=40, help="size of a site page")
+    parser.add_argument("--site-latency", type=float, default=0.05, help="seconds before a site answers")
+    parser.add_argument("--llm-latency", type=float, default=0.8, help="seconds per completion")
+    parser.add_argument("--llm-jitter", type=float, default=0.2, help="+/- seconds added to llm latency")
+    parser.add_argument("--stream-chunks", type=int, default=20, help="chunks per streamed completion")
+    parser.add_argument("--port", type=int, default=0, help="port for the stand-in services (default: any free)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=300.0, help="give up after this many seconds")
+    parser.add_argument("--database-url", help="database for the bot (default: temporary SQLite)")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    settings = Settings(
+        port=args.port or free_port(),
+        messages=args.messages,
+        rate=args.rate,
+        users=args.users,
+        sites=args.sites,
+        page_kb=args.page_kb,
+        site_latency=args.site_latency,
+        llm_latency=args.llm_latency,
+        llm_jitter=args.llm_jitter,
+        stream_chunks=max(1, args.stream_chunks),
+        seed=args.seed,
+    )
+
+    scratch = None
+    if args.database_url:
+        database_url = args.database_url
+    else:
+        scratch = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+        database_url = f"sqlite:///{scratch.name}"
+
+    configure_environment(settings.port, database_url)
+    fakes = multiprocessing.get_context("spawn").Process(target=serve_fakes, args=(settings,), daemon=True)
+    fakes.start()
+    try:
+        asyncio.run(wait_for_fakes(settings.port, fakes))
+        result = asyncio.run(run_bot(settings, args.timeout))
+    finally:
+        fakes.terminate()
+        fakes.join()
+        if scratch is not None:
+            scratch.close()
+            os.unlink(scratch.name)
+
+    report = summarize(settings, result)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if report["handled"] < report["sent"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
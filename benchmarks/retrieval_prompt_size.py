@@ -0,0 +1,76 @@
+"""
+Compare the Q&A context size with and without passage retrieval.
+
+Usage (from the repository root, with the same .env as the bot):
+    python -m benchmarks.retrieval_prompt_size https://example.com saved_page.html
+    python -m benchmarks.retrieval_prompt_size -q "Какие услуги?" -q "Контакты" pages/*.html
+
+Each argument is either a URL or a path to a saved HTML file.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+from config import RETRIEVAL_TOP_K, RETRIEVAL_CHUNK_SIZE, RETRIEVAL_CHUNK_OVERLAP
+from retrieval import build_index, search
+from services import clean_html_content, fetch_webpage_content
+
+DEFAULT_QUESTIONS = [
+    "Какие услуги вы оказываете?",
+    "Как с вами связаться?",
+    "Сколько стоят ваши услуги?",
+    "Где находится офис компании?",
+    "Сколько лет компания на рынке?",
+]
+
+
+async def load_page(source: str) -> str:
+    if os.path.exists(source):
+        with open(source, encoding="utf-8", errors="replace") as f:
+            html = f.read()
+    else:
+        html = (await fetch_webpage_content(source)).text
+    return await clean_html_content(html)
+
+
+async def run(sources, questions, top_k):
+    print(f"{'page':40} {'chunks':>6} {'full':>8} {'top-k':>8} {'saved':>7} {'index ms':>9}")
+    reductions = []
+    for source in sources:
+        text = await load_page(source)
+        if not text:
+            print(f"{source[:40]:40} (empty)")
+            continue
+
+        started = time.perf_counter()
+        index = build_index(text, RETRIEVAL_CHUNK_SIZE, RETRIEVAL_CHUNK_OVERLAP)
+        build_ms = (time.perf_counter() - started) * 1000
+
+        retrieved = [len("\n...\n".join(search(index, q, top_k))) for q in questions]
+        avg_retrieved = statistics.mean(retrieved)
+        saved = 1 - avg_retrieved / len(text)
+        reductions.append(saved)
+        print(
+            f"{source[:40]:40} {len(index['chunks']):>6} {len(text):>8} "
+            f"{avg_retrieved:>8.0f} {saved:>6.0%} {build_ms:>9.1f}"
+        )
+
+    if reductions:
+        print(f"\nMedian context reduction over {len(reductions)} pages: {statistics.median(reductions):.0%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("sources", nargs="+", help="URLs or saved HTML files")
+    parser.add_argument("-q", "--question", action="append", dest="questions", help="question to retrieve for")
+    parser.add_argument("-k", "--top-k", type=int, default=RETRIEVAL_TOP_K)
+    args = parser.parse_args()
+
+    asyncio.run(run(args.sources, args.questions or DEFAULT_QUESTIONS, args.top_k))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,17 @@
 import os
 from dotenv import load_dotenv
 
-# Load environment variables from .env file
-load_dotenv(override=True)
+# Load environment variables from .env file; SKIP_DOTENV=1 keeps the process environment as is
+if os.getenv("SKIP_DOTENV", "").strip().lower() not in ("1", "true", "yes", "on"):
+    load_dotenv(override=True)
+
+
+def _get_bool(name: str, default: bool = False) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
 
 # Bot configuration
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
@@ -23,6 +32,14 @@ OPENAI_ORGANIZATION = os.getenv("OPENAI_ORGANIZATION")
 if not OPENAI_ORGANIZATION:
     raise ValueError("OPENAI_ORGANIZATION is not set in environment variables")
 
+# Можно указать локальный сервер-заглушку, совместимый с OpenAI API
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "8"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "3"))
+OPENAI_RETRY_BASE_DELAY = float(os.getenv("OPENAI_RETRY_BASE_DELAY", "1"))
+
 # Yandex Search API
 YANDEX_FOLDERID = os.getenv("YANDEX_FOLDERID")
 if not YANDEX_FOLDERID:
@@ -30,4 +47,138 @@ if not YANDEX_FOLDERID:
 
 YANDEX_API_KEY = os.getenv("YANDEX_API_KEY")
 if not YANDEX_API_KEY:
-    raise ValueError("YANDEX_API_KEY is not set in environment variables") 
\ No newline at end of file
+    raise ValueError("YANDEX_API_KEY is not set in environment variables")
+
+# Telegram Bot API server; can point at a local Bot API server or a stand-in
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org").rstrip("/")
+
+# Telegram HTTP client (shared connection pool)
+TELEGRAM_MAX_CONNECTIONS = int(os.getenv("TELEGRAM_MAX_CONNECTIONS", "100"))
+TELEGRAM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("TELEGRAM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+TELEGRAM_KEEPALIVE_EXPIRY = float(os.getenv("TELEGRAM_KEEPALIVE_EXPIRY", "30"))
+TELEGRAM_HTTP2 = _get_bool("TELEGRAM_HTTP2")
+
+# Outbound rate limits: messages per second overall and per chat, retries after 429
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))
+TELEGRAM_CHAT_BURST = float(os.getenv("TELEGRAM_CHAT_BURST", "3"))
+TELEGRAM_SEND_QUEUE_SIZE = int(os.getenv("TELEGRAM_SEND_QUEUE_SIZE", "1000"))
+TELEGRAM_SEND_MAX_RETRIES = int(os.getenv("TELEGRAM_SEND_MAX_RETRIES", "3"))
+
+# Streaming answers (progressive editMessageText)
+STREAMING_ENABLED = _get_bool("STREAMING_ENABLED")
+TELEGRAM_EDIT_INTERVAL = float(os.getenv("TELEGRAM_EDIT_INTERVAL", "1.0"))
+
+# Update ingestion: polling (getUpdates) or webhook (local ASGI endpoint)
+BOT_MODE = os.getenv("BOT_MODE", "polling").strip().lower()
+if BOT_MODE not in ("polling", "webhook"):
+    raise ValueError("BOT_MODE must be either 'polling' or 'webhook'")
+
+# Webhook; WEBHOOK_URL is the public HTTPS address registered with Telegram on startup
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+if BOT_MODE == "webhook" and not WEBHOOK_SECRET:
+    raise ValueError("WEBHOOK_SECRET is required when BOT_MODE is 'webhook'")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram/webhook")
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+
+# Polling
+POLL_TIMEOUT = int(os.getenv("POLL_TIMEOUT", "30"))
+POLL_ERROR_DELAY = float(os.getenv("POLL_ERROR_DELAY", "5"))
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", "100"))
+
+# Update processing
+WORKER_COUNT = int(os.getenv("WORKER_COUNT", "8"))
+DISPATCHER_MAX_PENDING = int(os.getenv("DISPATCHER_MAX_PENDING", "100"))
+SHUTDOWN_TIMEOUT = float(os.getenv("SHUTDOWN_TIMEOUT", "30"))
+
+# Scale-out over a PostgreSQL job table: "all" handles updates in this process,
+# "ingest" only stores them in update_jobs, "worker" processes stored updates
+BOT_ROLE = os.getenv("BOT_ROLE", "all").strip().lower()
+if BOT_ROLE not in ("all", "ingest", "worker"):
+    raise ValueError("BOT_ROLE must be 'all', 'ingest' or 'worker'")
+if BOT_ROLE != "all" and not DATABASE_URL.startswith("postgres"):
+    raise ValueError("BOT_ROLE 'ingest' and 'worker' require a PostgreSQL DATABASE_URL")
+# A claimed job goes back to the queue if its worker stops renewing the lease for this long
+JOB_VISIBILITY_TIMEOUT = float(os.getenv("JOB_VISIBILITY_TIMEOUT", "120"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "0.5"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# Number of worker processes; they split TELEGRAM_GLOBAL_RATE between them
+BOT_WORKER_REPLICAS = int(os.getenv("BOT_WORKER_REPLICAS", "1"))
+if BOT_WORKER_REPLICAS < 1:
+    raise ValueError("BOT_WORKER_REPLICAS must be at least 1")
+TELEGRAM_PROCESS_RATE = TELEGRAM_GLOBAL_RATE / BOT_WORKER_REPLICAS if BOT_ROLE == "worker" else TELEGRAM_GLOBAL_RATE
+
+# Prometheus metrics on a local HTTP port
+METRICS_ENABLED = _get_bool("METRICS_ENABLED")
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+
+# Per-update trace spans: written as JSON log lines (log) or sent to an OTLP/HTTP collector (otlp)
+TRACING_ENABLED = _get_bool("TRACING_ENABLED")
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "log")
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "http://127.0.0.1:4318/v1/traces")
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "url-description-bot")
+
+# Sampling profiler for updates; toggled at runtime with SIGUSR1
+PROFILE_ENABLED = _get_bool("PROFILE_ENABLED")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0.05"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+# Database connection pool
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+# Compression of stored page content: auto (zstd if installed, else zlib), zstd, zlib or none
+CONTENT_COMPRESSION = os.getenv("CONTENT_COMPRESSION", "auto")
+CONTENT_COMPRESSION_LEVEL = int(os.getenv("CONTENT_COMPRESSION_LEVEL", "3"))
+
+# Site snapshot cache
+SITE_CACHE_TTL = int(os.getenv("SITE_CACHE_TTL", "3600"))
+SITE_CACHE_SIZE = int(os.getenv("SITE_CACHE_SIZE", "256"))
+
+# Company description cache
+DESCRIPTION_CACHE_SIZE = int(os.getenv("DESCRIPTION_CACHE_SIZE", "512"))
+DESCRIPTION_CACHE_MAX_BYTES = int(os.getenv("DESCRIPTION_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+
+# Q&A answer cache
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "2048"))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "21600"))
+
+# Per-chat site context kept in memory between questions
+CHAT_CONTEXT_CACHE_SIZE = int(os.getenv("CHAT_CONTEXT_CACHE_SIZE", "1024"))
+CHAT_CONTEXT_CACHE_MAX_BYTES = int(os.getenv("CHAT_CONTEXT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CHAT_CONTEXT_CACHE_TTL = int(os.getenv("CHAT_CONTEXT_CACHE_TTL", "600"))
+
+# Retrieval of relevant page passages for Q&A prompts
+RETRIEVAL_ENABLED = _get_bool("RETRIEVAL_ENABLED", True)
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "4"))
+RETRIEVAL_CHUNK_SIZE = int(os.getenv("RETRIEVAL_CHUNK_SIZE", "800"))
+RETRIEVAL_CHUNK_OVERLAP = int(os.getenv("RETRIEVAL_CHUNK_OVERLAP", "100"))
+if RETRIEVAL_CHUNK_SIZE <= 0 or not 0 <= RETRIEVAL_CHUNK_OVERLAP < RETRIEVAL_CHUNK_SIZE:
+    raise ValueError("RETRIEVAL_CHUNK_OVERLAP must be at least 0 and less than RETRIEVAL_CHUNK_SIZE")
+
+# Prompt token budgets per section
+PROMPT_CONTEXT_TOKENS = int(os.getenv("PROMPT_CONTEXT_TOKENS", "6000"))
+PROMPT_COMPANY_INFO_TOKENS = int(os.getenv("PROMPT_COMPANY_INFO_TOKENS", "300"))
+PROMPT_QUESTION_TOKENS = int(os.getenv("PROMPT_QUESTION_TOKENS", "300"))
+
+# HTML extraction: backend is auto, selectolax, lxml or bs4; 0 processes parses in the event loop
+EXTRACTOR_BACKEND = os.getenv("EXTRACTOR_BACKEND", "auto")
+EXTRACTOR_PROCESSES = int(os.getenv("EXTRACTOR_PROCESSES", "2"))
+EXTRACTOR_INLINE_MAX_BYTES = int(os.getenv("EXTRACTOR_INLINE_MAX_BYTES", "32768"))
+
+# Website fetching
+FETCH_MAX_BYTES = int(os.getenv("FETCH_MAX_BYTES", str(2 * 1024 * 1024)))
+FETCH_TIMEOUT = float(os.getenv("FETCH_TIMEOUT", "10"))
+
+# Optional crawl of about/services/contacts subpages
+CRAWL_ENABLED = _get_bool("CRAWL_ENABLED")
+CRAWL_MAX_PAGES = int(os.getenv("CRAWL_MAX_PAGES", "4"))
+CRAWL_PER_HOST_LIMIT = int(os.getenv("CRAWL_PER_HOST_LIMIT", "2"))
+CRAWL_DEADLINE = float(os.getenv("CRAWL_DEADLINE", "5"))
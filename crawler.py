@@ -0,0 +1,155 @@
+import asyncio
+import logging
+import re
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urljoin, urlsplit, urlunsplit
+from urllib.robotparser import RobotFileParser
+
+from cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+ROBOTS_USER_AGENT = "DescribeBot"
+
+# Subpages that usually describe the company, by URL path and anchor text
+_RELEVANT_LINK = re.compile(
+    r"about|company|o-nas|o-kompanii|about-us|services|uslugi|products|produkt|solutions|"
+    r"contact|kontakt|price|prices|ceny|tseny|pricing|"
+    r"о\s+нас|о\s+компании|компания|услуги|продукты|решения|контакты|цены|прайс|стоимость",
+    re.IGNORECASE,
+)
+_SKIP_EXTENSIONS = re.compile(r"\.(?:jpe?g|png|gif|svg|webp|pdf|zip|rar|docx?|xlsx?|pptx?|mp4|mp3)$", re.IGNORECASE)
+
+# robots.txt по хостам; None - файла нет или он недоступен
+_robots_cache = LRUCache(maxsize=512, ttl=3600)
+
+FetchText = Callable[[str], Awaitable[str]]
+
+
+def _host(url: str) -> str:
+    host = (urlsplit(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def find_relevant_links(base_url: str, page_links: Sequence[Tuple[str, str]], limit: int) -> List[str]:
+    """Same-domain links from the landing page that look like about/services/contacts pages"""
+    base_host = _host(base_url)
+    seen = {urlunsplit(urlsplit(base_url)._replace(fragment=""))}
+    links = []
+    for href, text in page_links:
+        url = urlunsplit(urlsplit(urljoin(base_url, href.strip()))._replace(fragment=""))
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or _host(url) != base_host:
+            continue
+        if url in seen or _SKIP_EXTENSIONS.search(parts.path):
+            continue
+        if not (_RELEVANT_LINK.search(parts.path) or _RELEVANT_LINK.search(text or "")):
+            continue
+        seen.add(url)
+        links.append(url)
+        if len(links) >= limit:
+            break
+    return links
+
+
+async def _robots_for(url: str, fetch_text: FetchText) -> Optional[RobotFileParser]:
+    parts = urlsplit(url)
+    key = f"{parts.scheme}://{parts.netloc}"
+    cached = _robots_cache.get(key, default=False)
+    if cached is not False:
+        return cached
+
+    parser: Optional[RobotFileParser] = None
+    try:
+        content = await fetch_text(f"{key}/robots.txt")
+        if content:
+            parser = RobotFileParser()
+            parser.parse(content.splitlines())
+    except Exception as e:
+        logger.debug(f"robots.txt for {key} is unavailable: {e}")
+    _robots_cache.set(key, parser)
+    return parser
+
+
+def merge_texts(texts: List[str]) -> str:
+    """Concatenate page texts, dropping sentences already seen on earlier pages"""
+    seen = set()
+    merged = []
+    for text in texts:
+        for sentence in re.split(r"(?<=[.!?…])\s+", text or ""):
+            key = " ".join(sentence.lower().split())
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            merged.append(sentence.strip())
+    return " ".join(merged)
+
+
+async def crawl_subpages(
+    base_url: str,
+    links: Sequence[Tuple[str, str]],
+    fetch_html: FetchText,
+    clean: Callable[[str], Awaitable[str]],
+    fetch_text: FetchText,
+    max_pages: int = 4,
+    per_host_limit: int = 2,
+    deadline: float = 5.0,
+) -> Dict[str, Any]:
+    """Fetch relevant same-domain subpages concurrently within a deadline
+
+    Args:
+        base_url: URL of the landing page
+        links: (href, anchor text) pairs of the landing page, see extractors.extract_links
+        fetch_html: Coroutine returning page HTML for a URL
+        clean: Coroutine turning HTML into text
+        fetch_text: Coroutine returning a plain-text resource (robots.txt)
+        max_pages: Maximum number of subpages to fetch
+        per_host_limit: Maximum concurrent requests to the host
+        deadline: Seconds after which unfinished fetches are cancelled
+
+    Returns:
+        Dict with the cleaned texts of fetched pages and crawl statistics
+    """
+    started = time.monotonic()
+    candidates = find_relevant_links(base_url, links, limit=max_pages * 3)
+    stats = {"candidates": len(candidates), "fetched": 0, "disallowed": 0, "timed_out": 0}
+    if not candidates:
+        return {"texts": [], "stats": stats}
+
+    robots = None
+    try:
+        robots = await asyncio.wait_for(_robots_for(base_url, fetch_text), timeout=deadline / 2)
+    except asyncio.TimeoutError:
+        logger.debug(f"robots.txt for {base_url} timed out")
+
+    urls = []
+    for url in candidates:
+        if robots is not None and not robots.can_fetch(ROBOTS_USER_AGENT, url):
+            stats["disallowed"] += 1
+            continue
+        urls.append(url)
+        if len(urls) >= max_pages:
+            break
+
+    semaphore = asyncio.Semaphore(per_host_limit)
+
+    async def fetch_page(url: str) -> str:
+        async with semaphore:
+            return await clean(await fetch_html(url))
+
+    tasks = [asyncio.create_task(fetch_page(url)) for url in urls]
+    remaining = max(0.0, deadline - (time.monotonic() - started))
+    done, pending = await asyncio.wait(tasks, timeout=remaining) if tasks else (set(), set())
+    for task in pending:
+        task.cancel()
+    stats["timed_out"] = len(pending)
+
+    # Порядок страниц сохраняем как на сайте, чтобы итоговый текст был стабильным
+    texts = []
+    for task in tasks:
+        if task in done and not task.cancelled() and task.exception() is None and task.result():
+            texts.append(task.result())
+    stats["fetched"] = len(texts)
+    stats["elapsed"] = round(time.monotonic() - started, 3)
+    return {"texts": texts, "stats": stats}
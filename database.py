@@ -1,15 +1,141 @@
-from sqlalchemy import create_engine, Column, BigInteger, String, DateTime, Text
+from sqlalchemy import (
+    create_engine, inspect, Column, BigInteger, Integer, String, DateTime, Text, JSON, ForeignKey, Index, LargeBinary
+)
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import deferred, sessionmaker
+from sqlalchemy.types import TypeDecorator
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import AsyncIterator, Optional, Union
 import datetime
+import zlib
 
-from config import DATABASE_URL
+from config import (
+    DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE,
+    CONTENT_COMPRESSION, CONTENT_COMPRESSION_LEVEL,
+)
 
 db_url = DATABASE_URL if DATABASE_URL else "sqlite:///./bot_database.db"
 engine = create_engine(db_url)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+
+def get_async_url(url: str) -> str:
+    """Map a sync database URL to its async driver (asyncpg / aiosqlite)"""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend == "postgresql":
+        parsed = parsed.set(drivername="postgresql+asyncpg")
+    elif backend == "sqlite":
+        parsed = parsed.set(drivername="sqlite+aiosqlite")
+    return parsed.render_as_string(hide_password=False)
+
+
+def _async_engine_options(url: str) -> dict:
+    # SQLite не использует пул соединений в том же смысле, что Postgres
+    if make_url(url).get_backend_name() == "sqlite":
+        return {}
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": True,
+    }
+
+
+async_db_url = get_async_url(db_url)
+async_engine = create_async_engine(async_db_url, **_async_engine_options(async_db_url))
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+
+# Первый байт сжатого значения - метка кодека; значения без метки - несжатый UTF-8
+_CODEC_TAGS = {"none": b"\x00", "zlib": b"\x01", "zstd": b"\x02"}
+
+
+def _zstd_available() -> bool:
+    try:
+        import zstandard  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def resolve_compression(name: str) -> str:
+    """Map a configured codec name ("auto" included) to an available one"""
+    if name == "auto":
+        return "zstd" if _zstd_available() else "zlib"
+    if name not in _CODEC_TAGS:
+        raise ValueError(f"Unknown content compression: {name}")
+    return name if name != "zstd" or _zstd_available() else "zlib"
+
+
+@lru_cache(maxsize=None)
+def _zstd_compressor(level: int):
+    import zstandard
+    return zstandard.ZstdCompressor(level=level)
+
+
+def compress_text(text: str, codec: str, level: int) -> bytes:
+    raw = text.encode("utf-8")
+    if codec == "zstd":
+        packed = _zstd_compressor(level).compress(raw)
+    elif codec == "zlib":
+        packed = zlib.compress(raw, level)
+    else:
+        packed = None
+    # Короткие строки сжатие только увеличивает
+    if packed is None or len(packed) >= len(raw):
+        return _CODEC_TAGS["none"] + raw
+    return _CODEC_TAGS[codec] + packed
+
+
+def decompress_text(data: Union[bytes, str]) -> str:
+    if isinstance(data, str):
+        return data
+    data = bytes(data)
+    tag, payload = data[:1], data[1:]
+    if tag == _CODEC_TAGS["zstd"]:
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress(payload).decode("utf-8")
+    if tag == _CODEC_TAGS["zlib"]:
+        return zlib.decompress(payload).decode("utf-8")
+    if tag == _CODEC_TAGS["none"]:
+        return payload.decode("utf-8")
+    # Текст, записанный до включения сжатия
+    return data.decode("utf-8")
+
+
+content_codec = resolve_compression(CONTENT_COMPRESSION)
+
+
+class CompressedText(TypeDecorator):
+    """Text stored compressed in a binary column, transparently for the ORM"""
+    impl = LargeBinary
+    cache_ok = True
+
+    def __init__(self, codec: Optional[str] = None, level: Optional[int] = None):
+        super().__init__()
+        # None - настройки из конфигурации
+        self.codec = codec
+        self.level = level
+
+    def process_bind_param(self, value: Optional[str], dialect) -> Optional[bytes]:
+        if value is None:
+            return None
+        codec = self.codec or content_codec
+        level = self.level if self.level is not None else CONTENT_COMPRESSION_LEVEL
+        return compress_text(value, codec, level)
+
+    def process_result_value(self, value: Optional[bytes], dialect) -> Optional[str]:
+        if value is None:
+            return None
+        return decompress_text(value)
+
+
 class ConferenceBot(Base):
     __tablename__ = "conference_bot"
 
@@ -21,14 +147,129 @@ class ConferenceBot(Base):
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
     site_url = Column(String(255), default="Не указано")
     title = Column(Text, default="Не указано")
-    cleaned_content = Column(Text)
+    # Current site of the user; the content itself is stored once per site
+    site_id = Column(Integer, ForeignKey("sites.id"), index=True)
+
+class Site(Base):
+    __tablename__ = "sites"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    # Normalized URL (see services.normalize_url)
+    url = Column(String(512), nullable=False, unique=True)
+    # sha256 of cleaned_content and company_info (see services.site_content_hash)
+    content_hash = Column(String(64), nullable=False)
+    title = Column(Text)
+    # Raw page text only; company info is kept separately in company_info.
+    # Large columns are compressed and loaded only when requested
+    cleaned_content = deferred(Column(CompressedText))
+    company_info = Column(JSON().with_variant(JSONB(), "postgresql"))
+    # JSON BM25 index over passages of cleaned_content (see retrieval.build_index)
+    content_index = deferred(Column(CompressedText))
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class SiteSnapshot(Base):
+    __tablename__ = "site_snapshots"
+
+    # Normalized URL (see services.normalize_url)
+    url = Column(String(512), primary_key=True)
+    cleaned_content = Column(CompressedText)
+    etag = Column(String(255))
+    last_modified = Column(String(255))
+    fetched_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+
+class DescriptionCache(Base):
+    __tablename__ = "description_cache"
+
+    # sha256 of prompt version, model and cleaned content
+    content_hash = Column(String(64), primary_key=True)
+    description = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class UpdateJob(Base):
+    __tablename__ = "update_jobs"
+    __table_args__ = (
+        # Поиск более ранних заданий того же чата при захвате (см. job_queue.JobWorker)
+        Index("ix_update_jobs_chat_id_id", "chat_id", "id"),
+    )
+
+    # Order of arrival; jobs of one chat are processed by increasing id
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    update_id = Column(BigInteger, unique=True)
+    chat_id = Column(BigInteger)
+    payload = Column(JSON().with_variant(JSONB(), "postgresql"), nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    # Worker holding the lease and when the lease runs out
+    locked_by = Column(String(64))
+    locked_until = Column(DateTime(timezone=True))
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+def _add_missing_columns(conn) -> None:
+    """Add nullable columns introduced after a table was first created"""
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing or not column.nullable:
+                continue
+            column_type = column.type.compile(dialect=conn.dialect)
+            conn.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}')
+
+def _convert_compressed_columns(conn) -> None:
+    """Turn text columns that now hold compressed content into binary ones"""
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"]: column["type"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if not isinstance(column.type, CompressedText) or column.name not in existing:
+                continue
+            if conn.dialect.name == "postgresql" and not isinstance(existing[column.name], LargeBinary):
+                conn.exec_driver_sql(
+                    f"ALTER TABLE {table.name} ALTER COLUMN {column.name} "
+                    f"TYPE BYTEA USING convert_to({column.name}, 'UTF8')"
+                )
+            elif conn.dialect.name == "sqlite":
+                # SQLite хранит тип значения, а не колонки: переводим старые строки в BLOB
+                conn.exec_driver_sql(
+                    f"UPDATE {table.name} SET {column.name} = CAST({column.name} AS BLOB) "
+                    f"WHERE typeof({column.name}) = 'text'"
+                )
+
+# Ключ advisory-блокировки схемы: процессы, стартующие одновременно (ingest и
+# все воркеры), создают и меняют таблицы по очереди, а не проверяют их наперегонки
+SCHEMA_LOCK_KEY = 0x626F74736368656D
+
+def _create_all(conn) -> None:
+    if conn.dialect.name == "postgresql":
+        # Снимается вместе с транзакцией, в которой меняется схема
+        conn.exec_driver_sql(f"SELECT pg_advisory_xact_lock({SCHEMA_LOCK_KEY})")
+    Base.metadata.create_all(bind=conn)
+    _add_missing_columns(conn)
+    _convert_compressed_columns(conn)
 
 def create_tables():
-    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        _create_all(conn)
+
+async def create_tables_async():
+    async with async_engine.begin() as conn:
+        await conn.run_sync(_create_all)
+
+async def dispose_engine():
+    await async_engine.dispose()
 
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+@asynccontextmanager
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    """Short-lived async session, one per handled update"""
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,131 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, Optional
+
+from config import WORKER_COUNT, DISPATCHER_MAX_PENDING
+
+logger = logging.getLogger(__name__)
+
+UpdateHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+def get_update_chat_id(update: Dict[str, Any]) -> Optional[int]:
+    """Extract chat id from a Telegram update, if any"""
+    return (update.get("message") or {}).get("chat", {}).get("id")
+
+
+class ChatDispatcher:
+    """Runs updates on a fixed pool of workers.
+
+    Updates from the same chat are handled strictly one after another in the
+    order they were submitted; different chats are handled in parallel.
+    """
+
+    def __init__(
+        self,
+        handler: UpdateHandler,
+        workers: int = WORKER_COUNT,
+        max_pending: int = DISPATCHER_MAX_PENDING,
+    ):
+        self.handler = handler
+        self.workers = workers
+        self._pending: Dict[Hashable, Deque[Dict[str, Any]]] = {}
+        # Чаты, у которых есть необработанные обновления и нет активного воркера
+        self._ready: asyncio.Queue = asyncio.Queue()
+        self._capacity = asyncio.Semaphore(max_pending)
+        self._tasks: List[asyncio.Task] = []
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._accepting = True
+        self.in_flight = 0
+        self.active = 0
+        self.processed = 0
+        self.failed = 0
+
+    def start(self) -> None:
+        """Start worker tasks"""
+        if self._tasks:
+            return
+        self._tasks = [
+            asyncio.create_task(self._worker(i), name=f"dispatcher-worker-{i}")
+            for i in range(self.workers)
+        ]
+        logger.info(f"Dispatcher started with {self.workers} workers")
+
+    def stats(self) -> Dict[str, Any]:
+        """Return counters describing the current load"""
+        return {
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "active": self.active,
+            "chats_pending": len(self._pending),
+            "processed": self.processed,
+            "failed": self.failed,
+        }
+
+    async def submit(self, update: Dict[str, Any]) -> None:
+        """Queue an update; waits while too many updates are already in flight"""
+        if not self._accepting:
+            raise RuntimeError("Dispatcher is shutting down")
+
+        await self._capacity.acquire()
+
+        key = get_update_chat_id(update)
+        if key is None:
+            # Обновления без чата не нужно упорядочивать
+            key = ("update", update.get("update_id"))
+
+        self.in_flight += 1
+        self._idle.clear()
+
+        queue = self._pending.get(key)
+        if queue is None:
+            self._pending[key] = deque([update])
+            self._ready.put_nowait(key)
+        else:
+            # Чат уже в работе или ожидает воркера, обновление будет обработано после предыдущих
+            queue.append(update)
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            key = await self._ready.get()
+            queue = self._pending[key]
+            update = queue[0]
+
+            self.active += 1
+            try:
+                await self.handler(update)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Worker {index} failed to handle update: {e}")
+            finally:
+                self.active -= 1
+                queue.popleft()
+                if queue:
+                    # Возвращаем чат в конец очереди, чтобы не блокировать остальные чаты
+                    self._ready.put_nowait(key)
+                else:
+                    del self._pending[key]
+
+                self.in_flight -= 1
+                self._capacity.release()
+                if self.in_flight == 0:
+                    self._idle.set()
+
+    async def drain(self, timeout: Optional[float] = None) -> None:
+        """Stop accepting updates, wait for in-flight ones and stop workers"""
+        self._accepting = False
+        if self.in_flight:
+            logger.info(f"Draining {self.in_flight} in-flight updates...")
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Drain timed out, {self.in_flight} updates left unprocessed")
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info(f"Dispatcher stopped: {self.stats()}")
@@ -0,0 +1,118 @@
+"""
+HTML to text extractor backends.
+
+Every backend drops <script>/<style> and returns text normalized the same way
+as the original BeautifulSoup implementation. Functions here are module-level
+and free of bot configuration so they can run in a worker process.
+"""
+
+from typing import Callable, Dict, List, Tuple
+
+Extractor = Callable[[str], str]
+
+
+def normalize_text(text: str) -> str:
+    lines = (line.strip() for line in text.splitlines())
+    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+    return ' '.join(chunk for chunk in chunks if chunk)
+
+
+def extract_bs4(html_content: str) -> str:
+    """Pure-Python BeautifulSoup + html.parser (reference behaviour)"""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html_content, 'html.parser')
+    for script in soup(["script", "style"]):
+        script.decompose()
+    return normalize_text(soup.get_text())
+
+
+def extract_lxml(html_content: str) -> str:
+    """libxml2-backed parser"""
+    import lxml.html
+
+    try:
+        document = lxml.html.document_fromstring(html_content)
+    except ValueError:
+        # Строки с XML-декларацией кодировки lxml принимает только как байты
+        document = lxml.html.document_fromstring(html_content.encode("utf-8"))
+    for element in list(document.iter("script", "style")):
+        element.drop_tree()
+    return normalize_text(document.text_content())
+
+
+def extract_selectolax(html_content: str) -> str:
+    """Lexbor-backed parser, usually the fastest"""
+    from selectolax.lexbor import LexborHTMLParser
+
+    tree = LexborHTMLParser(html_content)
+    tree.strip_tags(["script", "style"])
+    root = tree.root
+    return normalize_text(root.text(separator="") if root is not None else "")
+
+
+EXTRACTORS: Dict[str, Extractor] = {
+    "selectolax": extract_selectolax,
+    "lxml": extract_lxml,
+    "bs4": extract_bs4,
+}
+
+_MODULES = {"selectolax": "selectolax.lexbor", "lxml": "lxml.html", "bs4": "bs4"}
+
+
+def available_backends() -> List[str]:
+    """Installed backends, fastest first"""
+    import importlib.util
+
+    available = []
+    for name, module in _MODULES.items():
+        try:
+            if importlib.util.find_spec(module) is not None:
+                available.append(name)
+        except ModuleNotFoundError:
+            continue
+    return available
+
+
+def resolve_backend(name: str) -> str:
+    """Map a configured backend name ("auto" included) to an installed one"""
+    available = available_backends()
+    if name == "auto":
+        return available[0] if available else "bs4"
+    if name not in EXTRACTORS:
+        raise ValueError(f"Unknown HTML extractor backend: {name}")
+    return name if name in available else "bs4"
+
+
+def extract_text(html_content: str, backend: str = "bs4") -> str:
+    if not html_content:
+        return ""
+    return EXTRACTORS[backend](html_content)
+
+
+def extract_links(html_content: str) -> List[Tuple[str, str]]:
+    """Return (href, anchor text) pairs of all <a> elements"""
+    if not html_content:
+        return []
+    try:
+        import lxml.html
+    except ImportError:
+        from bs4 import BeautifulSoup
+
+        soup = BeautifulSoup(html_content, 'html.parser')
+        return [(a["href"], a.get_text(" ", strip=True)) for a in soup.find_all("a", href=True)]
+
+    try:
+        document = lxml.html.document_fromstring(html_content)
+    except ValueError:
+        document = lxml.html.document_fromstring(html_content.encode("utf-8"))
+    return [
+        (a.get("href"), " ".join(a.text_content().split()))
+        for a in document.iter("a")
+        if a.get("href")
+    ]
+
+
+def extract_page(html_content: str, backend: str = "bs4") -> Tuple[str, List[Tuple[str, str]]]:
+    """Text and links of a page in one call, so a worker process does both"""
+    return extract_text(html_content, backend), extract_links(html_content)
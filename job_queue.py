@@ -0,0 +1,245 @@
+import asyncio
+import datetime
+import logging
+import os
+import socket
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import delete, func, or_, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import aliased
+
+from config import WORKER_COUNT, JOB_VISIBILITY_TIMEOUT, JOB_POLL_INTERVAL, JOB_MAX_ATTEMPTS
+from database import UpdateJob, get_async_db
+from dispatcher import get_update_chat_id
+
+logger = logging.getLogger(__name__)
+
+UpdateHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class JobWriter:
+    """Stores incoming updates in the update_jobs table (BOT_ROLE=ingest).
+
+    Has the submit/drain/stats interface of ChatDispatcher, so it takes the
+    dispatcher's place behind the poller or webhook. Updates are inserted one
+    by one in arrival order, which is the order workers process a chat in.
+    """
+
+    def __init__(self, retry_delay: float = 1.0):
+        self.retry_delay = retry_delay
+        self.stored = 0
+        self.duplicates = 0
+        self.errors = 0
+
+    def start(self) -> None:
+        logger.info("Storing updates in update_jobs for worker processes")
+
+    def stats(self) -> Dict[str, Any]:
+        return {"stored": self.stored, "duplicates": self.duplicates, "errors": self.errors}
+
+    async def submit(self, update: Dict[str, Any]) -> None:
+        """Insert the update; retries until the database accepts it"""
+        statement = insert(UpdateJob).values(
+            update_id=update.get("update_id"),
+            chat_id=get_update_chat_id(update),
+            payload=update,
+        ).on_conflict_do_nothing(index_elements=["update_id"]).returning(UpdateJob.id)
+
+        while True:
+            try:
+                async with get_async_db() as db:
+                    inserted = (await db.execute(statement)).first() is not None
+                    await db.commit()
+                break
+            except Exception as e:
+                # Очередь обновлений заполняется, и poller перестает их забирать, пока база недоступна
+                self.errors += 1
+                logger.error(f"Error storing update {update.get('update_id')}: {e}")
+                await asyncio.sleep(self.retry_delay)
+
+        if inserted:
+            self.stored += 1
+        else:
+            # Telegram повторно доставил уже сохраненное обновление
+            self.duplicates += 1
+
+    async def drain(self, timeout: Optional[float] = None) -> None:
+        logger.info(f"Job writer stopped: {self.stats()}")
+
+
+class JobWorker:
+    """Processes updates stored in update_jobs (BOT_ROLE=worker).
+
+    Any number of worker processes claim jobs with SELECT ... FOR UPDATE SKIP
+    LOCKED. Only the oldest job of each chat can be claimed, and it stays in
+    the table until it is done, so a chat's updates are handled one at a time
+    in arrival order across all workers. A claimed job is leased for
+    JOB_VISIBILITY_TIMEOUT seconds and the lease is renewed while it runs; if
+    the worker dies, the lease runs out and another worker takes the job.
+    """
+
+    def __init__(
+        self,
+        handler: UpdateHandler,
+        concurrency: int = WORKER_COUNT,
+        visibility_timeout: float = JOB_VISIBILITY_TIMEOUT,
+        poll_interval: float = JOB_POLL_INTERVAL,
+        max_attempts: int = JOB_MAX_ATTEMPTS,
+    ):
+        self.handler = handler
+        self.concurrency = concurrency
+        self.visibility_timeout = visibility_timeout
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.token = f"{socket.gethostname()[:40]}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._active: Dict[int, asyncio.Task] = {}
+        self._slot_freed = asyncio.Event()
+        self._stopping = False
+        self.claimed = 0
+        self.completed = 0
+        self.abandoned = 0
+        self.lost_leases = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Return counters describing the current load"""
+        return {
+            "workers": self.concurrency,
+            "active": len(self._active),
+            "claimed": self.claimed,
+            "completed": self.completed,
+            "abandoned": self.abandoned,
+            "lost_leases": self.lost_leases,
+        }
+
+    def _lease_end(self):
+        return func.now() + datetime.timedelta(seconds=self.visibility_timeout)
+
+    async def _claim(self, limit: int) -> List[UpdateJob]:
+        earlier = aliased(UpdateJob)
+        has_earlier = select(earlier.id).where(
+            earlier.chat_id == UpdateJob.chat_id, earlier.id < UpdateJob.id
+        ).exists()
+        async with get_async_db() as db:
+            jobs = (await db.execute(
+                select(UpdateJob)
+                .where(
+                    or_(UpdateJob.locked_until.is_(None), UpdateJob.locked_until < func.now()),
+                    ~has_earlier,
+                )
+                .order_by(UpdateJob.id)
+                .limit(limit)
+                .with_for_update(skip_locked=True)
+            )).scalars().all()
+            if jobs:
+                await db.execute(
+                    update(UpdateJob)
+                    .where(UpdateJob.id.in_([job.id for job in jobs]))
+                    .values(locked_by=self.token, locked_until=self._lease_end(), attempts=UpdateJob.attempts + 1)
+                    .execution_options(synchronize_session="fetch")
+                )
+            await db.commit()
+        return jobs
+
+    async def _finish(self, job_id: int) -> None:
+        async with get_async_db() as db:
+            result = await db.execute(
+                delete(UpdateJob).where(UpdateJob.id == job_id, UpdateJob.locked_by == self.token)
+            )
+            await db.commit()
+        if not result.rowcount:
+            # Аренда истекла, и задание уже забрал другой воркер - оно будет обработано повторно
+            self.lost_leases += 1
+            logger.warning(f"Lease on job {job_id} was lost before it finished")
+
+    async def _process(self, job: UpdateJob) -> None:
+        try:
+            # attempts уже учитывает этот захват; прошлые попытки оборвались вместе с воркером
+            if job.attempts > self.max_attempts:
+                self.abandoned += 1
+                logger.error(
+                    f"Dropping update {job.update_id} of chat {job.chat_id} after {job.attempts - 1} attempts"
+                )
+            else:
+                try:
+                    await self.handler(job.payload)
+                except Exception as e:
+                    logger.error(f"Failed to handle update {job.update_id}: {e}")
+                self.completed += 1
+            await self._finish(job.id)
+        except Exception as e:
+            logger.error(f"Error finishing job {job.id}: {e}")
+        finally:
+            self._active.pop(job.id, None)
+            self._slot_freed.set()
+
+    async def _renew_leases(self) -> None:
+        while True:
+            await asyncio.sleep(self.visibility_timeout / 3)
+            if not self._active:
+                continue
+            try:
+                async with get_async_db() as db:
+                    await db.execute(
+                        update(UpdateJob)
+                        .where(UpdateJob.id.in_(list(self._active)), UpdateJob.locked_by == self.token)
+                        .values(locked_until=self._lease_end())
+                    )
+                    await db.commit()
+            except Exception as e:
+                logger.error(f"Error renewing job leases: {e}")
+
+    async def run(self) -> None:
+        """Claim and process jobs until drain() is called"""
+        logger.info(
+            f"Job worker {self.token} started with {self.concurrency} workers "
+            f"(visibility timeout {self.visibility_timeout}s)"
+        )
+        renewer = asyncio.create_task(self._renew_leases(), name="job-lease-renewer")
+        try:
+            while not self._stopping:
+                self._slot_freed.clear()
+                free = self.concurrency - len(self._active)
+                jobs: List[UpdateJob] = []
+                if free > 0:
+                    try:
+                        jobs = await self._claim(free)
+                    except Exception as e:
+                        logger.error(f"Error claiming jobs: {e}")
+                for job in jobs:
+                    self.claimed += 1
+                    self._active[job.id] = asyncio.create_task(self._process(job))
+                if free <= 0 or len(jobs) < free:
+                    # Законченное задание открывает следующее задание того же чата
+                    try:
+                        await asyncio.wait_for(self._slot_freed.wait(), self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            renewer.cancel()
+            await asyncio.gather(renewer, return_exceptions=True)
+
+    async def drain(self, timeout: Optional[float] = None) -> None:
+        """Stop claiming, wait for running jobs and hand unfinished ones back"""
+        self._stopping = True
+        self._slot_freed.set()
+        unfinished: List[int] = []
+        if self._active:
+            logger.info(f"Draining {len(self._active)} running jobs...")
+            _, pending = await asyncio.wait(list(self._active.values()), timeout=timeout)
+            unfinished = [job_id for job_id, task in self._active.items() if task in pending]
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        if unfinished:
+            async with get_async_db() as db:
+                await db.execute(
+                    update(UpdateJob)
+                    .where(UpdateJob.id.in_(unfinished), UpdateJob.locked_by == self.token)
+                    .values(locked_by=None, locked_until=None)
+                )
+                await db.commit()
+            logger.warning(f"Released {len(unfinished)} unfinished jobs")
+        logger.info(f"Job worker stopped: {self.stats()}")
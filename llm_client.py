@@ -0,0 +1,207 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Optional, Dict, Any, AsyncIterator
+
+from openai import AsyncOpenAI, APIConnectionError, APIStatusError, APITimeoutError
+
+from config import (
+    OPENAI_API_KEY,
+    OPENAI_BASE_URL,
+    OPENAI_MODEL,
+    OPENAI_MAX_CONCURRENCY,
+    OPENAI_TIMEOUT,
+    OPENAI_MAX_RETRIES,
+    OPENAI_RETRY_BASE_DELAY,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class LLMClient:
+    # Общий асинхронный клиент OpenAI и ограничение на число одновременных запросов
+    _client: Optional[AsyncOpenAI] = None
+    _semaphore: Optional[asyncio.Semaphore] = None
+    _stats = {
+        "calls": 0,
+        "errors": 0,
+        "retries": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "total_latency": 0.0,
+    }
+
+    @classmethod
+    async def startup(cls) -> None:
+        """Create the shared AsyncOpenAI client"""
+        if cls._client is not None:
+            return
+
+        # Повторы делаем сами, с джиттером, поэтому отключаем встроенные
+        cls._client = AsyncOpenAI(
+            api_key=OPENAI_API_KEY,
+            base_url=OPENAI_BASE_URL,
+            timeout=OPENAI_TIMEOUT,
+            max_retries=0,
+        )
+        cls._semaphore = asyncio.Semaphore(OPENAI_MAX_CONCURRENCY)
+        logger.info(
+            f"LLM client started (model={OPENAI_MODEL}, max_concurrency={OPENAI_MAX_CONCURRENCY}, "
+            f"base_url={OPENAI_BASE_URL or 'default'})"
+        )
+
+    @classmethod
+    async def shutdown(cls) -> None:
+        """Close the shared AsyncOpenAI client"""
+        if cls._client is None:
+            return
+
+        logger.info(f"Closing LLM client, stats: {cls.stats()}")
+        await cls._client.close()
+        cls._client = None
+        cls._semaphore = None
+
+    @classmethod
+    def stats(cls) -> Dict[str, Any]:
+        """Return call counters, token usage and average latency"""
+        stats = dict(cls._stats)
+        if stats["calls"]:
+            stats["avg_latency"] = round(stats["total_latency"] / stats["calls"], 3)
+        return stats
+
+    @staticmethod
+    def _is_retryable(error: Exception) -> bool:
+        if isinstance(error, (APITimeoutError, APIConnectionError)):
+            return True
+        if isinstance(error, APIStatusError):
+            return error.status_code == 429 or error.status_code >= 500
+        return False
+
+    @staticmethod
+    def _retry_delay(error: Exception, attempt: int) -> float:
+        # Если сервер подсказал, сколько ждать, используем это значение
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+
+        # Экспоненциальная задержка с "полным" джиттером
+        return random.uniform(0, OPENAI_RETRY_BASE_DELAY * (2 ** attempt))
+
+    @classmethod
+    async def _backoff(cls, error: Exception, attempt: int) -> None:
+        """Sleep before the next attempt or re-raise if the error is final"""
+        if attempt >= OPENAI_MAX_RETRIES or not cls._is_retryable(error):
+            cls._stats["errors"] += 1
+            raise error
+
+        delay = cls._retry_delay(error, attempt)
+        cls._stats["retries"] += 1
+        logger.warning(f"LLM call failed ({error}), retry {attempt + 1}/{OPENAI_MAX_RETRIES} in {delay:.2f}s")
+        await asyncio.sleep(delay)
+
+    @classmethod
+    def _record_call(cls, model: str, latency: float, usage: Any, retries: int, extra: str = "") -> None:
+        prompt_tokens = usage.prompt_tokens if usage else 0
+        completion_tokens = usage.completion_tokens if usage else 0
+
+        cls._stats["calls"] += 1
+        cls._stats["total_latency"] += latency
+        cls._stats["prompt_tokens"] += prompt_tokens
+        cls._stats["completion_tokens"] += completion_tokens
+        logger.info(
+            f"LLM call: model={model} latency={latency:.2f}s{extra} "
+            f"prompt_tokens={prompt_tokens} completion_tokens={completion_tokens} retries={retries}"
+        )
+
+    @classmethod
+    async def complete(cls, prompt: str, model: str = OPENAI_MODEL) -> str:
+        """Run a chat completion for a single user prompt
+
+        Args:
+            prompt: Prompt text sent as the user message
+            model: Model name
+
+        Returns:
+            Completion text
+
+        Raises:
+            openai.OpenAIError: If the request fails after all retries
+        """
+        if cls._client is None:
+            await cls.startup()
+
+        attempt = 0
+        while True:
+            started = time.monotonic()
+            try:
+                async with cls._semaphore:
+                    completion = await cls._client.chat.completions.create(
+                        model=model,
+                        messages=[
+                            {"role": "user", "content": prompt}
+                        ]
+                    )
+            except Exception as e:
+                await cls._backoff(e, attempt)
+                attempt += 1
+                continue
+
+            cls._record_call(model, time.monotonic() - started, completion.usage, attempt)
+            return completion.choices[0].message.content
+
+    @classmethod
+    async def stream(cls, prompt: str, model: str = OPENAI_MODEL) -> AsyncIterator[str]:
+        """Run a streaming chat completion and yield text deltas as they arrive
+
+        Only opening the stream is retried: once tokens have been yielded an
+        error is raised to the caller.
+
+        Raises:
+            openai.OpenAIError: If the request fails after all retries
+        """
+        if cls._client is None:
+            await cls.startup()
+
+        attempt = 0
+        while True:
+            started = time.monotonic()
+            await cls._semaphore.acquire()
+            try:
+                stream = await cls._client.chat.completions.create(
+                    model=model,
+                    messages=[
+                        {"role": "user", "content": prompt}
+                    ],
+                    stream=True,
+                    stream_options={"include_usage": True},
+                )
+                break
+            except Exception as e:
+                cls._semaphore.release()
+                await cls._backoff(e, attempt)
+                attempt += 1
+
+        usage = None
+        first_token = None
+        try:
+            async for chunk in stream:
+                if chunk.usage:
+                    usage = chunk.usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if first_token is None:
+                        first_token = time.monotonic() - started
+                    yield chunk.choices[0].delta.content
+        except Exception:
+            cls._stats["errors"] += 1
+            raise
+        finally:
+            cls._semaphore.release()
+            await stream.close()
+
+        ttft = f" ttft={first_token:.2f}s" if first_token is not None else ""
+        cls._record_call(model, time.monotonic() - started, usage, attempt, ttft)
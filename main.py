@@ -1,28 +1,49 @@
 import asyncio
 import logging
 import re
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Dict, Any, Optional
 
-from config import TELEGRAM_BOT_TOKEN
-from database import get_db, create_tables
-from telegram_client import TelegramClient
+from config import TELEGRAM_BOT_TOKEN, UPDATE_QUEUE_SIZE, SHUTDOWN_TIMEOUT, BOT_MODE, BOT_ROLE, WEBHOOK_URL
+from database import get_async_db, create_tables_async, dispose_engine, async_engine
+from telegram_client import TelegramClient, ProgressiveMessage
+from rate_limiter import PRIORITY_LOW
+from llm_client import LLMClient
+from poller import UpdatePoller
+from webhook import WebhookServer
+import metrics
+import profiling
+import tracing
+from prompts import load_tokenizer
+from dispatcher import ChatDispatcher
+from job_queue import JobWriter, JobWorker
 from services import (
     parse_url_from_message,
     save_url_to_db,
-    get_latest_url,
-    generate_ai_description,
-    generate_ai_question_answer
+    get_chat_context,
+    chat_context_cache,
+    get_company_description,
+    get_question_answer,
+    start_extractor_pool,
+    shutdown_extractor_pool
 )
 
 # Configure root logger for INFO level only
 logging.basicConfig(
     level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    format=(
+        "%(asctime)s - %(name)s - %(levelname)s - [%(trace_id)s] %(message)s"
+        if tracing.enabled
+        else "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    ),
 )
+if tracing.enabled:
+    # Строки логов одного обновления получают общий trace_id
+    for handler in logging.getLogger().handlers:
+        handler.addFilter(tracing.TraceIdFilter())
 
 # Make sure other loggers don't show DEBUG messages
-for logger_name in ['__main__', 'services', 'telegram_client']:
+for logger_name in ['__main__', 'services', 'telegram_client', 'rate_limiter', 'llm_client', 'poller', 'webhook', 'metrics', 'tracing', 'profiling', 'dispatcher', 'job_queue', 'prompts', 'crawler']:
     module_logger = logging.getLogger(logger_name)
     module_logger.setLevel(logging.INFO)
 logger = logging.getLogger(__name__)
@@ -30,9 +51,43 @@ logger = logging.getLogger(__name__)
 
 async def init_bot():
     """Инициализация бота при запуске"""
+    # Открываем общий пул соединений к Telegram API
+    await TelegramClient.startup()
+    if BOT_ROLE != "ingest":
+        await LLMClient.startup()
+        # Загружаем токенизатор заранее, чтобы не делать это при первом запросе
+        await asyncio.to_thread(load_tokenizer)
+        start_extractor_pool()
+
+    # Prometheus /metrics; без METRICS_ENABLED ничего не делает
+    metrics.instrument_engine(async_engine.sync_engine)
+    metrics.register_stats("telegram_pool", TelegramClient.pool_stats)
+    metrics.register_stats("telegram_send", TelegramClient.send_stats)
+    metrics.register_stats("llm", LLMClient.stats)
+    metrics.start_server()
+
+    # Трассировка обновлений и профилирование по SIGUSR1
+    tracing.instrument_engine(async_engine.sync_engine)
+    await tracing.start_exporter()
+    profiling.install_signal_handler()
+
     # Создаем таблицы при запуске
-    create_tables()
+    await create_tables_async()
+
+    if BOT_ROLE == "worker":
+        # Обновления получает процесс с BOT_ROLE=ingest, webhook настраивает он же
+        logger.info("Bot initialized as a job worker")
+        return
     
+    if BOT_MODE == "webhook":
+        # Регистрируем webhook, если задан публичный адрес; иначе он настроен снаружи
+        if WEBHOOK_URL:
+            result = await TelegramClient.set_webhook()
+            if not result.get("ok"):
+                logger.error(f"Error setting webhook: {result.get('description')}")
+        logger.info("Bot initialized for webhook mode")
+        return
+
     # Удаляем webhook, если он был настроен ранее
     try:
         webhook_info = await TelegramClient.get_webhook_info()
@@ -47,39 +102,40 @@ async def init_bot():
     logger.info("Bot initialized for polling mode")
 
 
-async def process_updates():
-    """Обработка обновлений через polling"""
-    db = next(get_db())
-    
-    try:
-        # Получаем обновления через polling
-        updates = await TelegramClient.get_updates(timeout=10)
-        
-        for update in updates:
-            # Создаем задачу для обработки каждого обновления
-            asyncio.create_task(handle_update(update, db))
-    except Exception as e:
-        logger.error(f"Error processing updates: {e}")
-    finally:
-        db.close()
+async def process_updates(queue: asyncio.Queue, dispatcher: ChatDispatcher):
+    """Передача обновлений из очереди poller'а или webhook'а в пул воркеров"""
+    while True:
+        update = await queue.get()
+        try:
+            # Ждем, если воркеры перегружены, - очередь заполняется, и источник обновлений притормаживает
+            await dispatcher.submit(update)
+        finally:
+            queue.task_done()
 
 
-async def handle_update(update: Dict[str, Any], db: Session):
+async def handle_update(update: Dict[str, Any]):
     """Обработка одного обновления"""
-    try:
-        message = update.get("message", {})
-        if not message:
-            return
-            
-        chat_id = message.get("chat", {}).get("id")
-        if not chat_id:
-            return
-            
-        # Обрабатываем сообщение
-        parsed_data = await parse_message(message)
-        await process_message(chat_id, parsed_data, db)
-    except Exception as e:
-        logger.error(f"Error handling update: {e}")
+    metrics.record_update()
+    message = update.get("message", {})
+    if not message:
+        return
+
+    chat_id = message.get("chat", {}).get("id")
+    if not chat_id:
+        return
+
+    with tracing.start_trace("update", chat_id=chat_id, update_id=update.get("update_id")):
+        async with profiling.maybe_profile(f"update-{update.get('update_id')}"):
+            try:
+                # Обрабатываем сообщение
+                parsed_data = await parse_message(message)
+
+                # Отдельная короткая сессия БД на каждое обновление
+                async with get_async_db() as db:
+                    await process_message(chat_id, parsed_data, db)
+            except Exception as e:
+                metrics.record_error("handle_update")
+                logger.error(f"Error handling update: {e}")
 
 
 async def parse_message(message: Dict[str, Any]) -> Dict[str, Any]:
@@ -117,7 +173,8 @@ async def parse_message(message: Dict[str, Any]) -> Dict[str, Any]:
     return result
 
 
-async def process_message(chat_id: int, parsed_data: Dict[str, Any], db: Session):
+@metrics.timed("process_message")
+async def process_message(chat_id: int, parsed_data: Dict[str, Any], db: AsyncSession):
     try:
         logger.info(f"Processing message: {parsed_data}")
         
@@ -145,43 +202,63 @@ async def process_message(chat_id: int, parsed_data: Dict[str, Any], db: Session
                 site = 'https://' + site
                 logger.info(f"Updated URL with scheme: {site}")
                 
-            # Send a waiting message while processing the website
-            await TelegramClient.send_message(chat_id, "Анализирую сайт компании... Это может занять несколько секунд.")
+            # Send a waiting message while processing the website; the site work does not wait for it
+            status = asyncio.create_task(TelegramClient.send_message(
+                chat_id, "Анализирую сайт компании... Это может занять несколько секунд.", priority=PRIORITY_LOW
+            ))
             
             logger.info("Calling save_url_to_db to fetch data from Yandex API...")
             # Save URL to database and fetch company info using Yandex API
-            await save_url_to_db(db, chat_id, site)
-
-            url_record = await get_latest_url(db, chat_id)
-            if not url_record or not url_record.cleaned_content:
+            try:
+                context = await save_url_to_db(db, chat_id, site)
+            finally:
+                # Статус, который так и не ушел из очереди, уже не нужен и не должен обогнать ответ
+                status.cancel()
+                await asyncio.gather(status, return_exceptions=True)
+            if not context or not context.cleaned_content:
                 await TelegramClient.send_message(chat_id, "Не удалось обработать сайт. Пожалуйста, проверьте URL и попробуйте снова.")
                 return
 
+            # In streaming mode the answer is shown progressively in one message
+            reply = ProgressiveMessage(chat_id)
             try:
                 # Generate AI description with company information
-                description = await generate_ai_description(url_record.cleaned_content)
-                await TelegramClient.send_message(chat_id, description)
+                await reply.start()
+                description = await get_company_description(
+                    db,
+                    context.cleaned_content,
+                    on_delta=reply.on_delta,
+                    company_info=context.company_info,
+                    site_hash=context.content_hash
+                )
+                await reply.finish(description)
                 
                 # If the original message included a query after the URL, process it as a question
                 if "query" in parsed_data and parsed_data["query"]:
                     query = parsed_data["query"]
                     try:
-                        answer = await generate_ai_question_answer(
-                            url_record.cleaned_content,
-                            query
+                        answer_reply = ProgressiveMessage(chat_id)
+                        await answer_reply.start()
+                        answer = await get_question_answer(
+                            context.cleaned_content,
+                            query,
+                            on_delta=answer_reply.on_delta,
+                            index=context.index,
+                            company_info=context.company_info,
+                            site_hash=context.content_hash
                         )
-                        await TelegramClient.send_message(chat_id, answer)
+                        await answer_reply.finish(answer)
                     except Exception as e:
                         logger.error(f"Initial query error: {e}")
                 
             except Exception as e:
                 logger.error(f"Description error: {e}")
-                await TelegramClient.send_message(chat_id, "Ошибка генерации описания компании. Пожалуйста, попробуйте позже.")
+                await reply.finish("Ошибка генерации описания компании. Пожалуйста, попробуйте позже.")
 
         else:
-            # Process question about the company
-            url_record = await get_latest_url(db, chat_id)
-            if not url_record:
+            # Process question about the company; the chat context is usually in memory
+            context = await get_chat_context(db, chat_id)
+            if not context:
                 await TelegramClient.send_message(
                     chat_id, 
                     "Пожалуйста, сначала отправьте ссылку на сайт компании.\n"
@@ -197,22 +274,28 @@ async def process_message(chat_id: int, parsed_data: Dict[str, Any], db: Session
                 await TelegramClient.send_message(chat_id, "Пожалуйста, задайте ваш вопрос о компании")
                 return
 
+            reply = ProgressiveMessage(chat_id)
             try:
-                answer = await generate_ai_question_answer(
-                    url_record.cleaned_content,
-                    query
+                await reply.start()
+                answer = await get_question_answer(
+                    context.cleaned_content,
+                    query,
+                    on_delta=reply.on_delta,
+                    index=context.index,
+                    company_info=context.company_info,
+                    site_hash=context.content_hash
                 )
-                await TelegramClient.send_message(chat_id, answer)
+                await reply.finish(answer)
             except Exception as e:
                 logger.error(f"Answer error: {e}")
                 # More detailed error message
-                await TelegramClient.send_message(
-                    chat_id, 
+                await reply.finish(
                     "Произошла ошибка при ответе на ваш вопрос. Возможно, информация о компании не была правильно загружена. "
                     "Пожалуйста, попробуйте заново отправить ссылку через /start example.com"
                 )
 
     except Exception as e:
+        metrics.record_error("process_message")
         logger.error(f"Process error: {e}")
         await TelegramClient.send_message(chat_id, "Возникла внутренняя ошибка. Пожалуйста, попробуйте позже.")
 
@@ -222,20 +305,43 @@ async def main():
     # Инициализируем бота
     await init_bot()
     
-    logger.info("Starting bot in polling mode with 1 second delay")
+    logger.info(f"Starting bot in {BOT_MODE} mode, role {BOT_ROLE}")
     
-    # Бесконечный цикл polling
-    while True:
-        try:
-            # Обрабатываем обновления
-            await process_updates()
-            
-            # Задержка 1 секунда между запросами
-            await asyncio.sleep(1)
-        except Exception as e:
-            logger.error(f"Error in main loop: {e}")
-            # В случае ошибки делаем небольшую паузу
-            await asyncio.sleep(5)
+    if BOT_ROLE == "worker":
+        # Обновления берутся из таблицы update_jobs, их записывает процесс с BOT_ROLE=ingest
+        source = None
+        dispatcher = JobWorker(handle_update)
+        running = [dispatcher.run()]
+    else:
+        # Poller держит long-poll открытым, а webhook принимает обновления по HTTP;
+        # оба складывают их в одну ограниченную очередь
+        queue: asyncio.Queue = asyncio.Queue(maxsize=UPDATE_QUEUE_SIZE)
+        source = WebhookServer(queue) if BOT_MODE == "webhook" else UpdatePoller(queue)
+
+        # Обновления одного чата обрабатываются по порядку, разных чатов - параллельно;
+        # с BOT_ROLE=ingest они только сохраняются в update_jobs для воркеров
+        dispatcher = JobWriter() if BOT_ROLE == "ingest" else ChatDispatcher(handle_update)
+        dispatcher.start()
+        metrics.register_stats("updates", source.stats)
+        running = [source.run(), process_updates(queue, dispatcher)]
+    metrics.register_stats("dispatcher", dispatcher.stats)
+    
+    try:
+        await asyncio.gather(*running)
+    finally:
+        if source is not None:
+            logger.info(f"Update source stats: {source.stats()}")
+        logger.info(f"Chat context cache stats: {chat_context_cache.stats()}")
+        if tracing.enabled:
+            logger.info(f"Tracing stats: {tracing.stats}")
+        # Дожидаемся обработки уже принятых обновлений
+        await dispatcher.drain(SHUTDOWN_TIMEOUT)
+        await dispose_engine()
+        await tracing.shutdown_exporter()
+        await LLMClient.shutdown()
+        shutdown_extractor_pool()
+        # Закрываем пул соединений к Telegram API
+        await TelegramClient.shutdown()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,183 @@
+"""
+Prometheus instrumentation.
+
+Pipeline stages are timed with the `timed` decorator, which also records a
+trace span when tracing is on; counters and gauges that components already
+keep (stats() methods, LRUCache counters) are read only when /metrics is
+scraped. With METRICS_ENABLED and TRACING_ENABLED off, or prometheus_client
+not installed, `timed` returns the function unchanged and the other helpers
+do nothing, so the hot path pays nothing.
+"""
+
+import functools
+import logging
+import time
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+import tracing
+from config import METRICS_ENABLED, METRICS_HOST, METRICS_PORT
+
+logger = logging.getLogger(__name__)
+
+F = TypeVar("F", bound=Callable[..., Any])
+StatsSource = Callable[[], Dict[str, Any]]
+
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 60.0)
+
+_sources: Dict[str, StatsSource] = {}
+_caches: Dict[str, Any] = {}
+_stage_seconds = None
+_errors = None
+_updates = None
+
+
+def _load_prometheus() -> bool:
+    if not METRICS_ENABLED:
+        return False
+    try:
+        import prometheus_client  # noqa: F401
+    except ImportError:
+        logger.warning("METRICS_ENABLED is set but prometheus_client is not installed, metrics are disabled")
+        return False
+    return True
+
+
+enabled = _load_prometheus()
+
+
+class _StatsCollector:
+    """Exports registered stats() sources and caches at scrape time"""
+
+    def collect(self):
+        from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+        for name, source in _sources.items():
+            try:
+                stats = source()
+            except Exception as e:
+                logger.debug(f"Stats source {name} failed: {e}")
+                continue
+            for key, value in stats.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    yield GaugeMetricFamily(f"bot_{name}_{key}", f"{name} {key}", value=value)
+
+        hits = CounterMetricFamily("bot_cache_hits", "Cache hits", labels=["cache"])
+        misses = CounterMetricFamily("bot_cache_misses", "Cache misses", labels=["cache"])
+        evictions = CounterMetricFamily("bot_cache_evictions", "Cache evictions", labels=["cache"])
+        entries = GaugeMetricFamily("bot_cache_entries", "Entries in cache", labels=["cache"])
+        size = GaugeMetricFamily("bot_cache_bytes", "Approximate cache size in bytes", labels=["cache"])
+        for name, cache in _caches.items():
+            hits.add_metric([name], cache.hits)
+            misses.add_metric([name], cache.misses)
+            evictions.add_metric([name], cache.evictions)
+            entries.add_metric([name], len(cache))
+            size.add_metric([name], cache.bytes)
+        yield from (hits, misses, evictions, entries, size)
+
+
+if enabled:
+    from prometheus_client import Counter, Histogram, REGISTRY
+
+    _stage_seconds = Histogram(
+        "bot_stage_seconds", "Time spent in a pipeline stage", ["stage"], buckets=STAGE_BUCKETS
+    )
+    _errors = Counter("bot_errors", "Errors by pipeline stage", ["stage"])
+    _updates = Counter("bot_updates", "Telegram updates handled")
+    REGISTRY.register(_StatsCollector())
+
+
+def timed(stage: str) -> Callable[[F], F]:
+    """Record the duration (and failures) of an async function as a pipeline stage"""
+    def decorator(func: F) -> F:
+        if not enabled and not tracing.enabled:
+            return func
+
+        if not enabled:
+            @functools.wraps(func)
+            async def traced(*args, **kwargs):
+                with tracing.span(stage):
+                    return await func(*args, **kwargs)
+
+            return traced
+
+        histogram = _stage_seconds.labels(stage)
+        errors = _errors.labels(stage)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                with tracing.span(stage):
+                    return await func(*args, **kwargs)
+            except Exception:
+                errors.inc()
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - started)
+
+        return wrapper
+
+    return decorator
+
+
+def observe(stage: str, seconds: float) -> None:
+    if enabled:
+        _stage_seconds.labels(stage).observe(seconds)
+
+
+def record_update() -> None:
+    if enabled:
+        _updates.inc()
+
+
+def record_error(stage: str) -> None:
+    if enabled:
+        _errors.labels(stage).inc()
+
+
+def register_stats(name: str, source: StatsSource) -> None:
+    """Export numeric fields of source() as bot_<name>_<field> gauges"""
+    if enabled:
+        _sources[name] = source
+
+
+def register_cache(name: str, cache: Any) -> None:
+    """Export hit/miss/eviction counters and size of an LRUCache"""
+    if enabled:
+        _caches[name] = cache
+
+
+def instrument_engine(engine: Any) -> None:
+    """Time every SQL statement of a (sync) SQLAlchemy engine as the db_query stage"""
+    if not enabled:
+        return
+    from sqlalchemy import event
+
+    histogram = _stage_seconds.labels("db_query")
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        histogram.observe(time.perf_counter() - started)
+
+    @event.listens_for(engine, "handle_error")
+    def on_error(context):
+        # Неудачный запрос тоже снимаем со стека, иначе он растет на соединении из пула
+        started = context.connection.info.get("query_started") if context.connection is not None else None
+        if started:
+            histogram.observe(time.perf_counter() - started.pop())
+
+
+def start_server(host: str = METRICS_HOST, port: int = METRICS_PORT) -> Optional[Any]:
+    """Serve /metrics from a background thread"""
+    if not enabled:
+        return None
+    from prometheus_client import start_http_server
+
+    server, _ = start_http_server(port, addr=host)
+    logger.info(f"Metrics available at http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,127 @@
+"""
+One-off migration to the normalized schema: page content that older versions
+stored per user in conference_bot (cleaned_content, company_info, content_index)
+is moved into one sites row per canonical URL, and the user row keeps only a
+site_id pointer. The legacy "YANDEX_COMPANY_INFO: {json}" suffix of
+cleaned_content is split into company_info on the way.
+Safe to run more than once; migrated rows have their legacy columns cleared.
+"""
+
+import datetime
+import json
+import logging
+
+from sqlalchemy import MetaData, Table, select, update
+
+from database import ConferenceBot, Site, SessionLocal, create_tables, engine
+from retrieval import build_index, dump_index
+from services import normalize_url, site_content_hash
+from config import RETRIEVAL_CHUNK_SIZE, RETRIEVAL_CHUNK_OVERLAP
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+MARKER = "\n\nYANDEX_COMPANY_INFO: "
+LEGACY_COLUMNS = ("cleaned_content", "company_info", "content_index")
+BATCH_SIZE = 500
+
+
+def split_company_info(content: str):
+    """Return (page text, company info) for a legacy cleaned_content value"""
+    position = content.rfind(MARKER)
+    if position == -1:
+        return content, None
+    try:
+        company_info = json.loads(content[position + len(MARKER):])
+    except json.JSONDecodeError:
+        return content, None
+    return content[:position], company_info
+
+
+def _load_company_info(value):
+    # Без модели колонка JSON отражается как текст на SQLite
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except json.JSONDecodeError:
+            return None
+    return value
+
+
+def migrate():
+    # Создает таблицу sites и колонку conference_bot.site_id
+    create_tables()
+    with engine.begin() as conn:
+        for index in ConferenceBot.__table__.indexes:
+            index.create(conn, checkfirst=True)
+
+    legacy = Table(ConferenceBot.__tablename__, MetaData(), autoload_with=engine)
+    present = [name for name in LEGACY_COLUMNS if name in legacy.c]
+    if "cleaned_content" not in present:
+        logger.info("No legacy content columns, nothing to migrate")
+        return 0
+
+    db = SessionLocal()
+    migrated = 0
+    sites = {}
+    try:
+        last_id = ""
+        while True:
+            rows = db.execute(
+                select(legacy.c.user_id, legacy.c.site_url, legacy.c.title, legacy.c.created_at,
+                       *[legacy.c[name] for name in present])
+                .where(legacy.c.user_id > last_id, legacy.c.cleaned_content.isnot(None))
+                .order_by(legacy.c.user_id)
+                .limit(BATCH_SIZE)
+            ).mappings().all()
+            if not rows:
+                break
+            for row in rows:
+                last_id = row["user_id"]
+                text, company_info = split_company_info(row["cleaned_content"])
+                company_info = _load_company_info(row.get("company_info")) or company_info or {}
+                url = normalize_url(row["site_url"] or "")
+                created_at = row["created_at"] or datetime.datetime.utcnow()
+
+                site = sites.get(url) or db.execute(select(Site).where(Site.url == url)).scalars().first()
+                # При расхождении копий разных пользователей побеждает самая свежая
+                if site is None or (site.updated_at or datetime.datetime.min) < created_at:
+                    if site is None:
+                        site = Site(url=url)
+                        db.add(site)
+                    new_hash = site_content_hash(text, company_info)
+                    if site.content_hash != new_hash:
+                        site.content_index = (
+                            row.get("content_index") if text == row["cleaned_content"] else None
+                        ) or dump_index(build_index(text, RETRIEVAL_CHUNK_SIZE, RETRIEVAL_CHUNK_OVERLAP))
+                        site.content_hash = new_hash
+                        site.cleaned_content = text
+                        site.company_info = company_info
+                    site.title = row["title"]
+                    site.updated_at = created_at
+                    db.flush()
+                sites[url] = site
+
+                db.execute(
+                    update(legacy)
+                    .where(legacy.c.user_id == row["user_id"])
+                    .values(site_id=site.id, **{name: None for name in present})
+                )
+                migrated += 1
+            db.commit()
+    finally:
+        db.close()
+    return migrated
+
+
+if __name__ == "__main__":
+    try:
+        logger.info("Moving site content into the sites table...")
+        count = migrate()
+        logger.info(f"Migrated {count} users")
+    except Exception as e:
+        logger.error(f"Error migrating sites: {e}")
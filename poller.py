@@ -0,0 +1,81 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Any, Optional
+
+from config import POLL_TIMEOUT, POLL_ERROR_DELAY
+from telegram_client import TelegramClient
+
+logger = logging.getLogger(__name__)
+
+
+class UpdatePoller:
+    """Keeps a getUpdates long-poll open and feeds updates into a bounded queue.
+
+    When the queue is full the poller stops fetching until a consumer frees
+    a slot, so Telegram keeps the backlog instead of our memory.
+    """
+
+    def __init__(self, queue: asyncio.Queue, timeout: int = POLL_TIMEOUT):
+        self.queue = queue
+        self.timeout = timeout
+        self.polls = 0
+        self.updates_received = 0
+        self.errors = 0
+        self.last_poll_rtt: Optional[float] = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Return queue depth and poll round-trip statistics"""
+        return {
+            "queue_depth": self.queue.qsize(),
+            "queue_maxsize": self.queue.maxsize,
+            "polls": self.polls,
+            "updates_received": self.updates_received,
+            "errors": self.errors,
+            "last_poll_rtt": self.last_poll_rtt,
+        }
+
+    def _free_slots(self) -> int:
+        if self.queue.maxsize <= 0:
+            return 100
+        return self.queue.maxsize - self.queue.qsize()
+
+    async def _wait_for_space(self) -> None:
+        # asyncio.Queue не умеет ждать освобождения места без put(),
+        # поэтому опрашиваем очередь с небольшим интервалом
+        if self._free_slots() <= 0:
+            logger.debug(f"Update queue is full ({self.queue.qsize()}), pausing polling")
+            while self._free_slots() <= 0:
+                await asyncio.sleep(0.05)
+
+    async def poll_once(self) -> int:
+        """Run a single long-poll and enqueue the received updates"""
+        await self._wait_for_space()
+
+        started = time.monotonic()
+        updates = await TelegramClient.get_updates(timeout=self.timeout, limit=self._free_slots())
+        self.last_poll_rtt = time.monotonic() - started
+        self.polls += 1
+        self.updates_received += len(updates)
+
+        for update in updates:
+            await self.queue.put(update)
+
+        logger.debug(
+            f"Poll returned {len(updates)} updates in {self.last_poll_rtt:.3f}s, "
+            f"queue depth {self.queue.qsize()}"
+        )
+        return len(updates)
+
+    async def run(self) -> None:
+        """Poll forever until cancelled"""
+        logger.info(f"Update poller started (timeout={self.timeout}s, queue size={self.queue.maxsize})")
+        while True:
+            try:
+                await self.poll_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Error getting updates: {e}")
+                await asyncio.sleep(POLL_ERROR_DELAY)
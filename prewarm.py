@@ -0,0 +1,169 @@
+"""
+Script to pre-warm the site caches for company domains known in advance.
+Run it before an event so the first user sending a site gets the answer without
+waiting for the fetch and the LLM.
+
+Usage:
+    python prewarm.py domains.txt                  # one domain or URL per line, "#" starts a comment
+    python prewarm.py domains.txt -c 16 --failed failed.txt
+
+Every domain goes through the same pipeline as a live request (fetch, clean,
+index, company description) and the results land in the database tiers of the
+caches: site snapshots, sites and descriptions. Domains with a snapshot younger
+than SITE_CACHE_TTL and a stored site and description are skipped, so an
+interrupted run is resumed by starting it again and a later run refreshes only
+stale sites; --force processes them anyway.
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+
+from database import DescriptionCache, Site, SiteSnapshot, create_tables_async, dispose_engine, get_async_db
+from llm_client import LLMClient
+from services import (
+    OPENAI_ERROR_RESPONSE,
+    description_key,
+    get_company_description,
+    load_site_context,
+    normalize_url,
+    shutdown_extractor_pool,
+    snapshot_is_fresh,
+    start_extractor_pool,
+)
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+def read_domains(path: str) -> List[str]:
+    """Unique site URLs from the file, in file order"""
+    urls: Dict[str, None] = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            domain = line.split("#", 1)[0].strip()
+            if not domain:
+                continue
+            if not domain.startswith(("http://", "https://")):
+                domain = "https://" + domain
+            urls.setdefault(domain)
+    return list(urls)
+
+
+async def is_warm(url: str) -> bool:
+    """The snapshot is fresh and the site row and its description are stored"""
+    key = normalize_url(url)
+    async with get_async_db() as db:
+        fetched_at = (await db.execute(
+            select(SiteSnapshot.fetched_at).where(SiteSnapshot.url == key)
+        )).scalar()
+        if not snapshot_is_fresh(fetched_at):
+            return False
+        site = (await db.execute(select(Site).where(Site.url == key))).scalars().first()
+        return site is not None and await db.get(DescriptionCache, description_key(site.content_hash)) is not None
+
+
+async def warm(url: str) -> Optional[str]:
+    """Run the live pipeline for one site; returns an error or None"""
+    async with get_async_db() as db:
+        context = await load_site_context(db, url)
+        if context is None:
+            await db.rollback()
+            return "no content"
+        await db.commit()
+        description = await get_company_description(
+            db, context.cleaned_content, company_info=context.company_info, site_hash=context.content_hash
+        )
+        if not description or description == OPENAI_ERROR_RESPONSE:
+            return "description failed"
+    return None
+
+
+async def worker(queue: asyncio.Queue, force: bool, stats: Dict[str, Any], failures: List[Tuple[str, str]]) -> None:
+    while True:
+        url = await queue.get()
+        try:
+            if not force and await is_warm(url):
+                stats["skipped"] += 1
+                continue
+            started = time.monotonic()
+            try:
+                error = await warm(url)
+            except Exception as e:
+                error = repr(e)
+            if error:
+                stats["failed"] += 1
+                failures.append((url, error))
+                logger.warning(f"{url}: {error}")
+            else:
+                stats["warmed"] += 1
+                logger.info(f"{url}: warmed in {time.monotonic() - started:.1f}s")
+        finally:
+            stats["done"] += 1
+            queue.task_done()
+
+
+async def prewarm(urls: List[str], concurrency: int, force: bool) -> Tuple[Dict[str, Any], List[Tuple[str, str]]]:
+    await create_tables_async()
+    await LLMClient.startup()
+    start_extractor_pool()
+
+    queue: asyncio.Queue = asyncio.Queue()
+    for url in urls:
+        queue.put_nowait(url)
+    stats = {"done": 0, "warmed": 0, "skipped": 0, "failed": 0}
+    failures: List[Tuple[str, str]] = []
+
+    workers = [asyncio.create_task(worker(queue, force, stats, failures)) for _ in range(concurrency)]
+    try:
+        await queue.join()
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        await LLMClient.shutdown()
+        shutdown_extractor_pool()
+        await dispose_engine()
+    return stats, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("domains", help="file with one domain or URL per line")
+    parser.add_argument("-c", "--concurrency", type=int, default=8, help="sites processed at the same time")
+    parser.add_argument("--force", action="store_true", help="process sites that are already warm")
+    parser.add_argument("--failed", help="write failed domains to this file, ready for a re-run")
+    args = parser.parse_args()
+
+    urls = read_domains(args.domains)
+    logger.info(f"Pre-warming {len(urls)} sites with concurrency {args.concurrency}...")
+    started = time.monotonic()
+    try:
+        stats, failures = asyncio.run(prewarm(urls, max(1, args.concurrency), args.force))
+    except KeyboardInterrupt:
+        logger.info("Interrupted, run the same command again to continue")
+        return
+
+    elapsed = time.monotonic() - started
+    logger.info(
+        f"Done in {elapsed:.1f}s: {stats['warmed']} warmed, {stats['skipped']} already warm, "
+        f"{stats['failed']} failed ({stats['warmed'] / elapsed if elapsed else 0:.2f} sites/s)"
+    )
+    for url, error in failures:
+        logger.info(f"Failed: {url} ({error})")
+    if args.failed and failures:
+        with open(args.failed, "w", encoding="utf-8") as f:
+            f.writelines(f"{url}\n" for url, _ in failures)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+On-demand profiling of update handling.
+
+While profiling is on, a PROFILE_SAMPLE_RATE share of updates is run under a
+profiler and the result is written to PROFILE_DIR, one file per update. It is
+switched on at start with PROFILE_ENABLED or at runtime with SIGUSR1
+(`kill -USR1 <pid>`), which toggles it without a restart.
+
+pyinstrument is used when installed: in async mode it follows the update's
+coroutine across awaits and writes an HTML report. Otherwise cProfile writes a
+.prof file (open with `python -m pstats` or snakeviz); cProfile sees the whole
+thread, so only one update is profiled at a time to keep reports readable.
+"""
+
+import asyncio
+import logging
+import os
+import random
+import signal
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from config import PROFILE_ENABLED, PROFILE_SAMPLE_RATE, PROFILE_DIR
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+enabled = PROFILE_ENABLED
+_active = False
+stats = {"profiled": 0, "skipped_busy": 0}
+
+
+def toggle() -> bool:
+    """Switch profiling on or off, returns the new state"""
+    global enabled
+    enabled = not enabled
+    logger.info(
+        f"Profiling {'enabled' if enabled else 'disabled'} "
+        f"(sample rate {PROFILE_SAMPLE_RATE}, output {os.path.abspath(PROFILE_DIR)})"
+    )
+    return enabled
+
+
+def install_signal_handler(loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+    """Toggle profiling on SIGUSR1; not available on Windows"""
+    loop = loop or asyncio.get_running_loop()
+    try:
+        loop.add_signal_handler(signal.SIGUSR1, toggle)
+    except (AttributeError, NotImplementedError, RuntimeError):
+        logger.debug("SIGUSR1 is not supported here, profiling can only be enabled with PROFILE_ENABLED")
+
+
+def _path(label: str, suffix: str) -> str:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    return os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{label}{suffix}")
+
+
+@asynccontextmanager
+async def maybe_profile(label: str) -> AsyncIterator[None]:
+    """Profile the enclosed block if profiling is on and the update is sampled"""
+    global _active
+    if not enabled or random.random() >= PROFILE_SAMPLE_RATE:
+        yield
+        return
+    if _active:
+        stats["skipped_busy"] += 1
+        yield
+        return
+
+    _active = True
+    try:
+        if pyinstrument is not None:
+            profiler = pyinstrument.Profiler(async_mode="enabled")
+            profiler.start()
+            try:
+                yield
+            finally:
+                profiler.stop()
+                path = _path(label, ".html")
+                await asyncio.to_thread(profiler.write_html, path)
+        else:
+            import cProfile
+
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+                path = _path(label, ".prof")
+                await asyncio.to_thread(profiler.dump_stats, path)
+        stats["profiled"] += 1
+        logger.info(f"Profile written to {path}")
+    finally:
+        _active = False
@@ -0,0 +1,120 @@
+import logging
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Кодировка токенизатора gpt-4o / gpt-4o-mini
+TOKENIZER_ENCODING = "o200k_base"
+
+_encoder = None
+_encoder_loaded = False
+
+# Запасной вариант без tiktoken: слова и отдельные знаки препинания
+_APPROX_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+# Верхняя оценка длины токена в символах: текст обрезается до токенизации,
+# чтобы не кодировать целую страницу ради нескольких тысяч токенов
+_MAX_CHARS_PER_TOKEN = 12
+
+
+def load_tokenizer():
+    """Load the tiktoken encoding once; returns None if tiktoken is unavailable"""
+    global _encoder, _encoder_loaded
+    if _encoder_loaded:
+        return _encoder
+
+    _encoder_loaded = True
+    try:
+        import tiktoken
+        _encoder = tiktoken.get_encoding(TOKENIZER_ENCODING)
+    except Exception as e:
+        logger.warning(f"tiktoken is not available ({e}), token counts are approximate")
+        _encoder = None
+    return _encoder
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    encoder = load_tokenizer()
+    if encoder is not None:
+        return len(encoder.encode(text, disallowed_special=()))
+    return len(_APPROX_TOKEN.findall(text))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Keep the beginning of text that fits into max_tokens"""
+    if not text or max_tokens <= 0:
+        return ""
+    text = text[:max_tokens * _MAX_CHARS_PER_TOKEN]
+    encoder = load_tokenizer()
+    if encoder is not None:
+        tokens = encoder.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        return encoder.decode(tokens[:max_tokens])
+
+    for i, match in enumerate(_APPROX_TOKEN.finditer(text)):
+        if i == max_tokens:
+            return text[:match.start()].rstrip()
+    return text
+
+
+def fit_passages(passages: Sequence[Tuple[int, str]], max_tokens: int, separator: str = "\n...\n") -> str:
+    """Fit ranked passages into the budget and join them in page order
+
+    Args:
+        passages: (position on page, text) pairs, most relevant first
+        max_tokens: Token budget for the joined text
+    """
+    chosen: List[Tuple[int, str]] = []
+    used = 0
+    separator_tokens = count_tokens(separator)
+    for position, passage in passages:
+        cost = count_tokens(passage) + (separator_tokens if chosen else 0)
+        if used + cost > max_tokens:
+            if not chosen:
+                # Даже самый релевантный фрагмент не помещается - обрезаем его
+                chosen.append((position, truncate_to_tokens(passage, max_tokens)))
+            break
+        chosen.append((position, passage))
+        used += cost
+    return separator.join(text for _, text in sorted(chosen))
+
+
+@dataclass
+class Section:
+    """A budgeted part of a prompt; either plain text or ranked passages"""
+    name: str
+    budget: int
+    text: str = ""
+    passages: Optional[Sequence[Tuple[int, str]]] = None
+
+
+def build_prompt(label: str, template: str, sections: Sequence[Section], **values: str) -> str:
+    """Fill the template, fitting every section into its token budget
+
+    Sections are placed into the template by name; extra keyword values are
+    inserted as is. Token usage per section is logged against its budget; only
+    the fitted text is tokenized, never the whole page.
+    """
+    filled: Dict[str, str] = dict(values)
+    usage = []
+    total = count_tokens(template)
+    for section in sections:
+        if section.passages is not None:
+            text = fit_passages(section.passages, section.budget)
+        else:
+            text = truncate_to_tokens(section.text, section.budget)
+        filled[section.name] = text
+
+        used = count_tokens(text)
+        total += used
+        note = " (truncated)" if section.passages is None and len(text) < len(section.text) else ""
+        usage.append(f"{section.name}={used}/{section.budget}{note}")
+
+    prompt = template.format(**filled)
+    logger.info(f"Prompt {label}: ~{total} tokens, {', '.join(usage)}")
+    return prompt
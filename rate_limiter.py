@@ -0,0 +1,294 @@
+import asyncio
+import itertools
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+from config import (
+    TELEGRAM_PROCESS_RATE,
+    TELEGRAM_CHAT_RATE,
+    TELEGRAM_CHAT_BURST,
+    TELEGRAM_SEND_QUEUE_SIZE,
+    TELEGRAM_SEND_MAX_RETRIES,
+)
+
+logger = logging.getLogger(__name__)
+
+# Меньше - раньше: ответы обгоняют служебные сообщения
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+SendCall = Callable[[], Awaitable[Dict[str, Any]]]
+
+
+class TokenBucket:
+    """Allows `rate` operations per second with bursts of up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: Optional[float] = None) -> float:
+        """Seconds until a token is available"""
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+
+@dataclass
+class _Chat:
+    bucket: TokenBucket
+    queued: int = 0
+    in_flight: bool = False
+    # Telegram ответил 429 - до этого момента чату ничего не отправляем
+    blocked_until: float = 0.0
+
+
+@dataclass(order=True)
+class _Item:
+    priority: int
+    seq: int
+    chat_id: Hashable = field(compare=False)
+    call: SendCall = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    retries: int = field(compare=False)
+    enqueued_at: float = field(compare=False)
+    attempts: int = field(default=0, compare=False)
+
+
+class SendScheduler:
+    """Sends outbound Telegram messages within global and per-chat rate limits.
+
+    Messages wait in a priority queue; a message is sent when both the global
+    bucket and its chat's bucket have a token. Messages to one chat are sent
+    one at a time in queue order. A 429 answer blocks the chat for the
+    retry_after Telegram asks for and puts the message back in the queue.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = TELEGRAM_PROCESS_RATE,
+        chat_rate: float = TELEGRAM_CHAT_RATE,
+        chat_burst: float = TELEGRAM_CHAT_BURST,
+        max_queue: int = TELEGRAM_SEND_QUEUE_SIZE,
+        max_retries: int = TELEGRAM_SEND_MAX_RETRIES,
+    ):
+        self.global_bucket = TokenBucket(global_rate, max(1.0, global_rate))
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self._queue: List[_Item] = []
+        self._chats: Dict[Hashable, _Chat] = {}
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._sending: set = set()
+        self.dispatched = 0
+        self.sent = 0
+        self.retried = 0
+        self.dropped = 0
+        self.rate_limited = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="telegram-send-scheduler")
+
+    async def close(self, timeout: float) -> None:
+        """Wait up to timeout for queued messages, then stop"""
+        deadline = time.monotonic() + timeout
+        while (self._queue or self._sending) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for item in self._queue:
+            self._drop(item, "scheduler stopped")
+        self._queue.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return queue depth, wait times and drop counters"""
+        return {
+            "queued": len(self._queue),
+            "in_flight": len(self._sending),
+            "sent": self.sent,
+            "retried": self.retried,
+            "rate_limited": self.rate_limited,
+            "dropped": self.dropped,
+            "avg_wait": round(self.total_wait / self.dispatched, 3) if self.dispatched else 0.0,
+            "max_wait": round(self.max_wait, 3),
+        }
+
+    async def submit(
+        self,
+        chat_id: Hashable,
+        call: SendCall,
+        priority: int = PRIORITY_HIGH,
+        retries: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """Queue a send and wait for Telegram's response
+
+        Args:
+            chat_id: Chat the message goes to
+            call: Coroutine function performing the API request
+            priority: PRIORITY_HIGH, PRIORITY_NORMAL or PRIORITY_LOW
+            retries: Retries after 429, defaults to max_retries
+
+        Returns:
+            Telegram response; {"ok": False, ...} if the message was dropped
+
+        Cancelling the caller withdraws a message that is still queued; one
+        already being sent is delivered anyway.
+        """
+        if self._task is None:
+            self.start()
+
+        future = asyncio.get_running_loop().create_future()
+        item = _Item(
+            priority=priority,
+            seq=next(self._seq),
+            chat_id=chat_id,
+            call=call,
+            future=future,
+            retries=self.max_retries if retries is None else retries,
+            enqueued_at=time.monotonic(),
+        )
+        if len(self._queue) >= self.max_queue:
+            self._drop(item, "send queue is full")
+        else:
+            self._enqueue(item)
+        try:
+            return await future
+        except asyncio.CancelledError:
+            if item in self._queue:
+                self._queue.remove(item)
+                self._chat(item.chat_id).queued -= 1
+            raise
+
+    def _chat(self, chat_id: Hashable) -> _Chat:
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = _Chat(TokenBucket(self.chat_rate, self.chat_burst))
+            self._chats[chat_id] = chat
+        return chat
+
+    def _enqueue(self, item: _Item) -> None:
+        self._queue.append(item)
+        self._queue.sort()
+        self._chat(item.chat_id).queued += 1
+        self._wakeup.set()
+
+    def _drop(self, item: _Item, reason: str) -> None:
+        self.dropped += 1
+        logger.warning(f"Dropping message to chat {item.chat_id}: {reason}")
+        if not item.future.done():
+            item.future.set_result({"ok": False, "description": f"Dropped: {reason}"})
+
+    def _next_ready(self, now: float):
+        """Return (item, 0) for the first sendable message or (None, seconds to wait)"""
+        wait: Optional[float] = None
+        blocked = set()
+        for item in self._queue:
+            if item.chat_id in blocked:
+                continue
+            # Следующее сообщение чата ждет предыдущее, чтобы не нарушить порядок
+            blocked.add(item.chat_id)
+            chat = self._chat(item.chat_id)
+            if chat.in_flight:
+                continue
+            delay = max(chat.blocked_until - now, chat.bucket.delay(now))
+            if delay <= 0:
+                return item, 0.0
+            wait = delay if wait is None else min(wait, delay)
+        return None, wait
+
+    def _prune(self, now: float) -> None:
+        for chat_id in [
+            chat_id for chat_id, chat in self._chats.items()
+            if not chat.queued and not chat.in_flight and chat.blocked_until <= now and chat.bucket.is_full(now)
+        ]:
+            del self._chats[chat_id]
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            item, wait = self._next_ready(now)
+            if item is None:
+                if not self._queue:
+                    self._prune(now)
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            global_delay = self.global_bucket.delay(now)
+            if global_delay > 0:
+                # После паузы выбираем заново - могли прийти более важные сообщения
+                await asyncio.sleep(global_delay)
+                continue
+
+            self.global_bucket.take()
+            chat = self._chat(item.chat_id)
+            chat.bucket.take()
+            chat.queued -= 1
+            chat.in_flight = True
+            self._queue.remove(item)
+
+            waited = now - item.enqueued_at
+            self.dispatched += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+
+            task = asyncio.create_task(self._send(item, chat))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _send(self, item: _Item, chat: _Chat) -> None:
+        try:
+            result = await item.call()
+        except Exception as e:
+            if not item.future.done():
+                item.future.set_exception(e)
+            return
+        finally:
+            chat.in_flight = False
+            self._wakeup.set()
+
+        retry_after = (result.get("parameters") or {}).get("retry_after")
+        if result.get("error_code") == 429 and retry_after:
+            self.rate_limited += 1
+            chat.blocked_until = time.monotonic() + retry_after
+            if item.attempts < item.retries:
+                item.attempts += 1
+                self.retried += 1
+                logger.info(f"Telegram asked to retry chat {item.chat_id} after {retry_after}s")
+                item.enqueued_at = time.monotonic()
+                self._enqueue(item)
+                return
+            self.dropped += 1
+            logger.warning(f"Giving up on message to chat {item.chat_id} after {item.attempts} retries")
+        else:
+            self.sent += 1
+
+        if not item.future.done():
+            item.future.set_result(result)
@@ -0,0 +1,132 @@
+import json
+import math
+import re
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+# Common Russian inflection endings, longest first, for a light-weight stemmer
+_RU_SUFFIXES = sorted([
+    "иями", "ями", "ами", "ией", "ий", "ый", "ой", "ей", "ие", "ые", "ое", "ее",
+    "ая", "яя", "ого", "его", "ому", "ему", "ыми", "ими", "ую", "юю", "ах", "ях",
+    "ов", "ев", "ом", "ем", "ам", "ям", "ию", "ия", "ы", "и", "а", "я", "о", "е",
+    "у", "ю", "ь",
+], key=len, reverse=True)
+
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+")
+
+# BM25 parameters
+K1 = 1.5
+B = 0.75
+
+INDEX_VERSION = 1
+
+
+def stem_ru(word: str) -> str:
+    for suffix in _RU_SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase, drop punctuation and strip common Russian endings"""
+    text = (text or "").lower().replace("ё", "е")
+    return [stem_ru(word) for word in re.findall(r"\w+", text)]
+
+
+def split_into_chunks(text: str, chunk_size: int = 800, overlap: int = 100) -> List[str]:
+    """Split text into passages of about chunk_size characters on sentence boundaries
+
+    The last `overlap` characters of a passage are repeated at the start of the
+    next one so facts spanning a boundary are not lost.
+    """
+    if chunk_size <= 0 or not 0 <= overlap < chunk_size:
+        raise ValueError("overlap must be at least 0 and less than chunk_size")
+    sentences = [s for s in _SENTENCE_END.split(text or "") if s.strip()]
+    chunks: List[str] = []
+    current = ""
+    for sentence in sentences:
+        # Очень длинные "предложения" (меню, списки без точек) режем по длине
+        while len(sentence) > chunk_size:
+            head, sentence = sentence[:chunk_size], sentence[chunk_size - overlap:]
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(head)
+
+        if current and len(current) + len(sentence) + 1 > chunk_size:
+            chunks.append(current)
+            # Перекрытие начинаем с целого слова
+            tail = current[-overlap:] if overlap else ""
+            current = tail[tail.find(" ") + 1:] if " " in tail else tail
+        current = f"{current} {sentence}".strip()
+
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def build_index(text: str, chunk_size: int = 800, overlap: int = 100) -> Dict[str, Any]:
+    """Build a BM25 index over the passages of a page"""
+    chunks = split_into_chunks(text, chunk_size, overlap)
+    term_freqs = [dict(Counter(tokenize(chunk))) for chunk in chunks]
+    lengths = [sum(tf.values()) for tf in term_freqs]
+
+    doc_freq: Counter = Counter()
+    for tf in term_freqs:
+        doc_freq.update(tf.keys())
+
+    return {
+        "version": INDEX_VERSION,
+        "chunks": chunks,
+        "tf": term_freqs,
+        "lengths": lengths,
+        "df": dict(doc_freq),
+        "avgdl": (sum(lengths) / len(lengths)) if lengths else 0.0,
+    }
+
+
+def dump_index(index: Dict[str, Any]) -> str:
+    return json.dumps(index, ensure_ascii=False, separators=(",", ":"))
+
+
+def load_index(raw: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Parse a stored index, returning None for missing or outdated ones"""
+    if not raw:
+        return None
+    try:
+        index = json.loads(raw)
+    except (TypeError, ValueError):
+        return None
+    if index.get("version") != INDEX_VERSION:
+        return None
+    return index
+
+
+def search_ranked(index: Dict[str, Any], query: str, top_k: int = 4) -> List[Tuple[int, str]]:
+    """Return (position, passage) pairs for the query, most relevant first"""
+    chunks = index["chunks"]
+    n = len(chunks)
+    avgdl = index["avgdl"] or 1.0
+    terms = set(tokenize(query))
+    scores = []
+    for i, tf in enumerate(index["tf"]):
+        score = 0.0
+        length_norm = K1 * (1 - B + B * index["lengths"][i] / avgdl)
+        for term in terms:
+            freq = tf.get(term)
+            if not freq:
+                continue
+            df = index["df"][term]
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            score += idf * freq * (K1 + 1) / (freq + length_norm)
+        scores.append((score, i))
+
+    best = sorted(scores, key=lambda item: (-item[0], item[1]))[:top_k]
+    return [(i, chunks[i]) for _, i in best]
+
+
+def search(index: Dict[str, Any], query: str, top_k: int = 4) -> List[str]:
+    """Return the top_k passages for the query, in page order"""
+    # Сохраняем порядок страницы, чтобы контекст читался связно
+    return [passage for _, passage in sorted(search_ranked(index, query, top_k))]
@@ -1,23 +1,149 @@
+import asyncio
 import httpx
 import re
-from bs4 import BeautifulSoup
-from openai import OpenAI
-from typing import List, Dict, Any, Optional
-from sqlalchemy.orm import Session
+from typing import List, Dict, Any, Optional, Callable, Awaitable, Sequence, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit, urlunsplit
+from charset_normalizer import from_bytes
+from sqlalchemy import inspect as sa_inspect, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import undefer
 import datetime
+import hashlib
 import json
 import logging
-
-from config import YANDEX_FOLDERID, YANDEX_API_KEY, OPENAI_API_KEY
-from database import ConferenceBot
+import multiprocessing
+import time
+
+from config import (
+    BOT_ROLE,
+    YANDEX_FOLDERID,
+    YANDEX_API_KEY,
+    SITE_CACHE_TTL,
+    SITE_CACHE_SIZE,
+    OPENAI_MODEL,
+    DESCRIPTION_CACHE_SIZE,
+    DESCRIPTION_CACHE_MAX_BYTES,
+    ANSWER_CACHE_SIZE,
+    ANSWER_CACHE_TTL,
+    CHAT_CONTEXT_CACHE_SIZE,
+    CHAT_CONTEXT_CACHE_MAX_BYTES,
+    CHAT_CONTEXT_CACHE_TTL,
+    RETRIEVAL_ENABLED,
+    RETRIEVAL_TOP_K,
+    RETRIEVAL_CHUNK_SIZE,
+    RETRIEVAL_CHUNK_OVERLAP,
+    PROMPT_CONTEXT_TOKENS,
+    PROMPT_COMPANY_INFO_TOKENS,
+    PROMPT_QUESTION_TOKENS,
+    EXTRACTOR_BACKEND,
+    EXTRACTOR_PROCESSES,
+    EXTRACTOR_INLINE_MAX_BYTES,
+    FETCH_MAX_BYTES,
+    FETCH_TIMEOUT,
+    CRAWL_ENABLED,
+    CRAWL_MAX_PAGES,
+    CRAWL_PER_HOST_LIMIT,
+    CRAWL_DEADLINE,
+)
+from database import ConferenceBot, Site, SiteSnapshot, DescriptionCache
+from llm_client import LLMClient
+from cache import LRUCache, default_sizeof
+import metrics
+from retrieval import build_index, dump_index, load_index, search_ranked, tokenize
+from prompts import Section, build_prompt
+from extractors import extract_page, extract_text, resolve_backend
+from crawler import crawl_subpages, merge_texts
 
 logger = logging.getLogger(__name__)
 
-try:
-    openai_client = OpenAI(api_key=OPENAI_API_KEY)
-except Exception as e:
-    logger.error(f"Error initializing OpenAI client: {e}")
-    openai_client = None
+
+@dataclass
+class FetchResult:
+    status_code: int = 0
+    text: str = ""
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    bytes_read: int = 0
+    ttfb: Optional[float] = None
+    truncated: bool = False
+
+    @property
+    def not_modified(self) -> bool:
+        return self.status_code == 304
+
+
+@dataclass
+class Snapshot:
+    url: str
+    content: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fetched_at: datetime.datetime
+
+
+@dataclass
+class ChatContext:
+    """Site data a chat needs to get answers, cached between its messages"""
+    site_id: int
+    url: str
+    content_hash: str
+    company_info: Optional[Dict[str, Any]]
+    # Пустая строка, если для ответов на вопросы хватает индекса
+    cleaned_content: str
+    # Разобранный BM25-индекс (retrieval.load_index); None - отвечаем по тексту
+    index: Optional[Dict[str, Any]]
+    # Размер сохраненного JSON индекса, для бюджета кэша
+    index_bytes: int = 0
+
+
+@dataclass
+class _KeyLock:
+    """Lock of one cache key and the number of coroutines holding or awaiting it"""
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    users: int = 0
+
+
+def _context_size(context: ChatContext) -> int:
+    # Разобранный индекс в памяти занимает больше своего JSON
+    return default_sizeof(context.cleaned_content) + 2 * context.index_bytes + 256
+
+
+# In-process tier of the site snapshot cache; the database is the persistent tier
+snapshot_cache = LRUCache(maxsize=SITE_CACHE_SIZE, ttl=SITE_CACHE_TTL)
+_snapshot_locks: Dict[str, _KeyLock] = {}
+
+# HTML extraction runs in worker processes so large pages don't stall the event loop
+extractor_backend = resolve_backend(EXTRACTOR_BACKEND)
+_extractor_pool: Optional[ProcessPoolExecutor] = None
+
+# Bump when the description prompt changes so old cached descriptions are not reused
+DESCRIPTION_PROMPT_VERSION = "2"
+OPENAI_ERROR_RESPONSE = "Ошибка генерации ответа."
+
+# In-memory front of the description_cache table
+description_cache = LRUCache(maxsize=DESCRIPTION_CACHE_SIZE, max_bytes=DESCRIPTION_CACHE_MAX_BYTES)
+description_db_stats = {"hits": 0, "misses": 0}
+
+# Answers keyed by (content hash, normalized question)
+answer_cache = LRUCache(maxsize=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL)
+
+# Current site context per chat; written through by save_url_to_db
+chat_context_cache = LRUCache(
+    maxsize=CHAT_CONTEXT_CACHE_SIZE,
+    ttl=CHAT_CONTEXT_CACHE_TTL,
+    max_bytes=CHAT_CONTEXT_CACHE_MAX_BYTES,
+    sizeof=_context_size,
+)
+
+# Hit/miss counters exported on /metrics
+metrics.register_cache("site_snapshots", snapshot_cache)
+metrics.register_cache("descriptions", description_cache)
+metrics.register_cache("answers", answer_cache)
+metrics.register_cache("chat_contexts", chat_context_cache)
+metrics.register_stats("description_db", lambda: dict(description_db_stats))
 
 
 async def parse_url_from_message(message_text: str, dialog_id: int) -> Dict[str, Any]:
@@ -93,78 +219,436 @@ async def parse_url_from_message(message_text: str, dialog_id: int) -> Dict[str,
     return {"query": original_text, "type": "query", "dialog_id": dialog_id}
 
 
-async def save_url_to_db(db: Session, dialog_id: int, website: str) -> None:
+@metrics.timed("save_site")
+async def save_url_to_db(db: AsyncSession, dialog_id: int, website: str) -> Optional[ChatContext]:
     logger.debug(f"save_url_to_db called with website: {website} for dialog_id: {dialog_id}")
-    
-    # Fetch website content regardless of caching
-    content = await fetch_webpage_content(website)
-    cleaned_text = await clean_html_content(content)
-    logger.debug(f"Fetched and cleaned website content. Size: {len(content)} bytes, cleaned: {len(cleaned_text)} bytes")
-    
-    # Get basic company info without using Yandex API
-    logger.debug(f"Getting basic company info for website {website}...")
-    company_info = await search_with_yandex("", website)        
-    logger.debug(f"Generated basic company info. Company name: {company_info.get('company_name', 'Unknown')}")
-    
-    # Combine the information - use cleaned text and add the company info
-    combined_text = cleaned_text
-    if company_info:
-        company_info_str = json.dumps(company_info, ensure_ascii=False)
-        combined_text = f"{cleaned_text}\n\nYANDEX_COMPANY_INFO: {company_info_str}"
-    
+    context = await load_site_context(db, website)
+    if context is None:
+        # Сайт не загрузился - пользователь остается на прежнем сайте
+        await db.rollback()
+        return None
+    company_name = context.company_info.get('company_name', 'Не указано')
+
     # Check if we already have information about this user
-    existing = db.query(ConferenceBot).filter(
-        ConferenceBot.user_id == str(dialog_id)
-    ).first()
+    result = await db.execute(
+        select(ConferenceBot).where(ConferenceBot.user_id == str(dialog_id))
+    )
+    existing = result.scalars().first()
 
     # Default values for new fields
     username = "Не указано"
     industry = "Прочее"
     position = "Рядовой сотрудник"
-    company_name = company_info.get('company_name', 'Не указано')
     
-    # Save data to database (update existing or create new)
+    # Point the user at the site (update existing or create new)
     if existing:
         logger.debug(f"Updating existing record for {website}")
         existing.created_at = datetime.datetime.utcnow()
-        existing.cleaned_content = combined_text
+        existing.site_id = context.site_id
+        existing.site_url = website
         existing.title = company_name
-        db.commit()
     else:
         logger.debug(f"Creating new record for {website}")
         new_url = ConferenceBot(
             user_id=str(dialog_id),
+            site_id=context.site_id,
             site_url=website,
-            cleaned_content=combined_text,
             user_name=username,
             sphere=industry,
             user_position=position,
             title=company_name
         )
         db.add(new_url)
-        db.commit()
+    await db.commit()
     
+    chat_context_cache.set(dialog_id, context)
     logger.debug(f"Successfully saved company information to database for {website}")
-    # Return value to indicate success
-    return
+    return context
+
+
+async def load_site_context(db: AsyncSession, website: str) -> Optional[ChatContext]:
+    """Cleaned content and shared site row of a website, fetched only when stale
+
+    Returns None, without touching the sites table, when the site has no
+    content. Also used by prewarm.py; the caller commits.
+    """
+    # Cleaned website content, from the snapshot cache when it is fresh
+    snapshot = await get_site_snapshot(db, website)
+    cleaned_text = snapshot.content
+    logger.debug(f"Got website snapshot. Cleaned: {len(cleaned_text)} bytes")
+    if not cleaned_text:
+        return None
+    
+    # Get basic company info without using Yandex API
+    logger.debug(f"Getting basic company info for website {website}...")
+    company_info = await search_with_yandex("", website)        
+    logger.debug(f"Generated basic company info. Company name: {company_info.get('company_name', 'Unknown')}")
+    company_name = company_info.get('company_name', 'Не указано')
+
+    site, index = await _save_site(db, snapshot.url, cleaned_text, company_info, company_name)
+    if RETRIEVAL_ENABLED and index is None:
+        # Запись сайта только что добавил другой процесс - читаем его индекс
+        if "content_index" in sa_inspect(site).unloaded:
+            await db.refresh(site, ["content_index"])
+        index = await asyncio.to_thread(load_index, site.content_index)
+    return ChatContext(
+        site.id, site.url, site.content_hash, site.company_info, cleaned_text,
+        index, len(site.content_index or "") if index is not None else 0,
+    )
+
+
+async def _save_site(
+    db: AsyncSession,
+    url: str,
+    cleaned_text: str,
+    company_info: Dict[str, Any],
+    title: str,
+) -> Tuple[Site, Optional[Dict[str, Any]]]:
+    """Insert or refresh the shared row of a site; unchanged content is not rewritten
+
+    Returns the site and its parsed index (None when retrieval is off or the
+    row was just written by someone else). An unchanged site gets only its
+    index rebuilt when the stored one is outdated (INDEX_VERSION bump) or
+    cannot be parsed.
+    """
+    new_hash = site_content_hash(cleaned_text, company_info)
+    site = (await db.execute(select(Site).where(Site.url == url))).scalars().first()
+    if site is not None and site.content_hash == new_hash:
+        logger.debug(f"Site {url} is unchanged, reusing stored content")
+        if not RETRIEVAL_ENABLED:
+            return site, None
+        if "content_index" in sa_inspect(site).unloaded:
+            await db.refresh(site, ["content_index"])
+        index = await asyncio.to_thread(load_index, site.content_index)
+        if index is None:
+            logger.info(f"Rebuilding outdated content index of {url}")
+            index, site.content_index = await _build_content_index(cleaned_text)
+            await db.flush()
+        return site, index
+
+    # Lexical index over page passages for question answering
+    index, content_index = await _build_content_index(cleaned_text)
+
+    if site is None:
+        site = Site(url=url)
+        db.add(site)
+    else:
+        # Содержимое сайта изменилось - старые ответы больше не актуальны
+        invalidate_answers(site.content_hash)
+    site.content_hash = new_hash
+    site.title = title
+    site.cleaned_content = cleaned_text
+    site.company_info = company_info
+    site.content_index = content_index
+    site.updated_at = datetime.datetime.utcnow()
+    try:
+        await db.flush()
+    except IntegrityError:
+        # Сайт только что добавил другой пользователь - берем его запись
+        await db.rollback()
+        site = (await db.execute(select(Site).where(Site.url == url))).scalars().one()
+        return site, None
+    return site, index if RETRIEVAL_ENABLED else None
+
 
+def _index_text(cleaned_text: str) -> Tuple[Dict[str, Any], str]:
+    index = build_index(cleaned_text, RETRIEVAL_CHUNK_SIZE, RETRIEVAL_CHUNK_OVERLAP)
+    return index, dump_index(index)
 
-async def get_latest_url(db: Session, dialog_id: int) -> Optional[ConferenceBot]:
-    return db.query(ConferenceBot).filter(
-        ConferenceBot.user_id == str(dialog_id)
-    ).order_by(ConferenceBot.created_at.desc()).first()
 
+async def _build_content_index(cleaned_text: str) -> Tuple[Dict[str, Any], str]:
+    """Build the BM25 index of a page off the event loop; returns it parsed and serialized"""
+    return await asyncio.to_thread(_index_text, cleaned_text)
 
-async def fetch_webpage_content(url: str) -> str:
+
+async def get_latest_url(
+    db: AsyncSession, dialog_id: int, load: Sequence[str] = ()
+) -> Optional[Site]:
+    """Current site of the user
+
+    Page text and index are deferred; `load` names the ones to fetch with the row
+    ("cleaned_content", "content_index").
+    """
+    result = await db.execute(
+        select(Site).join(ConferenceBot, ConferenceBot.site_id == Site.id).where(
+            ConferenceBot.user_id == str(dialog_id)
+        ).options(*[undefer(getattr(Site, name)) for name in load])
+    )
+    record = result.scalars().first()
+    # Завершаем транзакцию, чтобы не держать соединение из пула во время вызова LLM
+    await db.commit()
+    return record
+
+
+async def load_question_context(db: AsyncSession, site: Site) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """Return (cleaned_text, parsed index) needed to answer a question about the site
+
+    Only the index is read when retrieval can use it; it is parsed once, off
+    the event loop. The full text is fetched as a fallback for sites without
+    an index or with an outdated one.
+    """
+    unloaded = sa_inspect(site).unloaded
+    if RETRIEVAL_ENABLED:
+        if "content_index" in unloaded:
+            await db.refresh(site, ["content_index"])
+        index = await asyncio.to_thread(load_index, site.content_index)
+        if index is not None:
+            await db.commit()
+            return "", index
+    if "cleaned_content" in unloaded:
+        await db.refresh(site, ["cleaned_content"])
+    await db.commit()
+    return site.cleaned_content or "", None
+
+
+async def _context_is_current(db: AsyncSession, dialog_id: int, context: ChatContext) -> bool:
+    """The chat still points at the cached site and the site content is unchanged"""
+    row = (await db.execute(
+        select(Site.id, Site.content_hash).join(ConferenceBot, ConferenceBot.site_id == Site.id).where(
+            ConferenceBot.user_id == str(dialog_id)
+        )
+    )).first()
+    await db.commit()
+    return row is not None and (row.id, row.content_hash) == (context.site_id, context.content_hash)
+
+
+@metrics.timed("chat_context")
+async def get_chat_context(db: AsyncSession, dialog_id: int) -> Optional[ChatContext]:
+    """Site context of the chat for answering questions, from memory when possible"""
+    context = chat_context_cache.get(dialog_id)
+    # Сайт чата мог сменить другой воркер - его кэш этот процесс не видит
+    if context is not None and (BOT_ROLE != "worker" or await _context_is_current(db, dialog_id, context)):
+        return context
+
+    load = ("content_index",) if RETRIEVAL_ENABLED else ("cleaned_content",)
+    site = await get_latest_url(db, dialog_id, load=load)
+    if site is None:
+        return None
+    cleaned_text, index = await load_question_context(db, site)
+    context = ChatContext(
+        site.id, site.url, site.content_hash, site.company_info, cleaned_text,
+        index, len(site.content_index or "") if index is not None else 0,
+    )
+    chat_context_cache.set(dialog_id, context)
+    return context
+
+
+def normalize_url(url: str) -> str:
+    """Canonical form of a URL used as the snapshot cache key"""
+    parts = urlsplit(url.strip())
+    scheme = (parts.scheme or "https").lower()
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    port = parts.port
+    if port and not ((scheme == "http" and port == 80) or (scheme == "https" and port == 443)):
+        host = f"{host}:{port}"
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((scheme, host, path, parts.query, ""))
+
+
+def snapshot_is_fresh(fetched_at: Optional[datetime.datetime]) -> bool:
+    if fetched_at is None:
+        return False
+    age = (datetime.datetime.utcnow() - fetched_at).total_seconds()
+    return age < SITE_CACHE_TTL
+
+
+@metrics.timed("site_snapshot")
+async def get_site_snapshot(db: AsyncSession, url: str) -> Snapshot:
+    """Return cleaned site content, fetching it only when the cached copy is stale
+
+    Lookup order: in-process LRU, then the site_snapshots table. A stale
+    database copy is revalidated with If-None-Match/If-Modified-Since, so an
+    unchanged page costs a 304 and no parsing.
+    """
+    key = normalize_url(url)
+    snapshot = snapshot_cache.get(key)
+    if snapshot is not None:
+        logger.debug(f"Snapshot cache hit (memory) for {key}")
+        return snapshot
+
+    # Одновременные запросы одного сайта ждут друг друга, а не качают его заново
+    entry = _snapshot_locks.get(key)
+    if entry is None:
+        entry = _snapshot_locks[key] = _KeyLock()
+    entry.users += 1
+    try:
+        async with entry.lock:
+            snapshot = snapshot_cache.get(key, count=False)
+            if snapshot is not None:
+                return snapshot
+            return await _load_site_snapshot(db, key, url)
+    finally:
+        # Запись удаляем, только когда замок больше никто не ждет
+        entry.users -= 1
+        if not entry.users:
+            _snapshot_locks.pop(key, None)
+
+
+async def _load_site_snapshot(db: AsyncSession, key: str, url: str) -> Snapshot:
+    record = await db.get(SiteSnapshot, key)
+    if record is not None and snapshot_is_fresh(record.fetched_at):
+        logger.debug(f"Snapshot cache hit (database) for {key}")
+        snapshot = Snapshot(key, record.cleaned_content or "", record.etag, record.last_modified, record.fetched_at)
+        snapshot_cache.set(key, snapshot)
+        return snapshot
+
+    result = await fetch_webpage_content(
+        url,
+        etag=record.etag if record else None,
+        last_modified=record.last_modified if record else None,
+    )
+
+    now = datetime.datetime.utcnow()
+    if result.not_modified and record is not None:
+        logger.debug(f"Snapshot for {key} not modified, reusing stored content")
+        record.fetched_at = now
+    elif 200 <= result.status_code < 300 and result.text:
+        if CRAWL_ENABLED:
+            # Ссылки на подстраницы извлекаются тем же вызовом, что и текст
+            cleaned, links = await extract_page_content(result.text)
+            cleaned = await crawl_site(url, links, cleaned)
+        else:
+            cleaned = await clean_html_content(result.text)
+        if record is None:
+            record = SiteSnapshot(url=key)
+            db.add(record)
+        record.cleaned_content = cleaned
+        record.etag = result.etag
+        record.last_modified = result.last_modified
+        record.fetched_at = now
+    else:
+        # Сайт недоступен или вернул ошибку/редирект - отдаем то, что есть, но не кэшируем
+        content = record.cleaned_content if record else ""
+        return Snapshot(key, content or "", None, None, now)
+
+    snapshot = Snapshot(key, record.cleaned_content or "", record.etag, record.last_modified, now)
+    try:
+        await db.commit()
+    except IntegrityError:
+        # Запись уже создана параллельным процессом
+        await db.rollback()
+
+    snapshot_cache.set(key, snapshot)
+    return snapshot
+
+
+async def _fetch_html(url: str) -> str:
+    # Страницы ошибок и тела редиректов в текст сайта не попадают
+    result = await fetch_webpage_content(url)
+    return result.text if 200 <= result.status_code < 300 else ""
+
+
+async def _fetch_text(url: str) -> str:
+    result = await fetch_webpage_content(url)
+    return result.text if result.status_code == 200 else ""
+
+
+@metrics.timed("crawl")
+async def crawl_site(url: str, landing_links: Sequence[Tuple[str, str]], landing_text: str) -> str:
+    """Add about/services/contacts subpages of the site to the landing page text"""
+    crawl = await crawl_subpages(
+        url,
+        landing_links,
+        fetch_html=_fetch_html,
+        clean=clean_html_content,
+        fetch_text=_fetch_text,
+        max_pages=CRAWL_MAX_PAGES,
+        per_host_limit=CRAWL_PER_HOST_LIMIT,
+        deadline=CRAWL_DEADLINE,
+    )
+    logger.debug(f"Crawled {url}: {crawl['stats']}")
+    if not crawl["texts"]:
+        return landing_text
+    return merge_texts([landing_text] + crawl["texts"])
+
+
+# Content types we are able to turn into text
+HTML_CONTENT_TYPES = ("text/html", "application/xhtml+xml", "text/plain")
+
+_META_CHARSET = re.compile(rb"""<meta[^>]+charset=["']?([a-zA-Z0-9_-]+)""", re.IGNORECASE)
+
+
+def decode_html(body: bytes, declared_charset: Optional[str] = None) -> str:
+    """Decode a page using the declared charset, then <meta charset>, then detection"""
+    candidates = [declared_charset]
+    meta = _META_CHARSET.search(body[:4096])
+    if meta:
+        candidates.append(meta.group(1).decode("ascii", "ignore"))
+    candidates.append("utf-8")
+
+    for charset in candidates:
+        if not charset:
+            continue
+        try:
+            return body.decode(charset)
+        except (LookupError, UnicodeDecodeError):
+            continue
+
+    # Определяем кодировку по началу документа, а не по всему телу
+    best = from_bytes(body[:65536]).best()
+    return body.decode(best.encoding if best else "utf-8", errors="replace")
+
+
+@metrics.timed("fetch")
+async def fetch_webpage_content(
+    url: str, etag: Optional[str] = None, last_modified: Optional[str] = None
+) -> FetchResult:
+    """Fetch a page, sending conditional headers when validators are known
+
+    The body is streamed and cut off at FETCH_MAX_BYTES; responses that are
+    not HTML are rejected as soon as the headers arrive.
+    """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    started = time.monotonic()
     async with httpx.AsyncClient() as client:
         try:
-            response = await client.get(url, timeout=10.0)
-            return response.text
+            async with client.stream("GET", url, headers=headers, timeout=FETCH_TIMEOUT) as response:
+                ttfb = time.monotonic() - started
+                if response.status_code == 304:
+                    return FetchResult(status_code=304, ttfb=ttfb)
+
+                content_type = response.headers.get("content-type", "")
+                mime_type = content_type.split(";")[0].strip().lower()
+                if mime_type and mime_type not in HTML_CONTENT_TYPES:
+                    logger.warning(f"Skipping {url}: unsupported content type {mime_type}")
+                    return FetchResult(status_code=response.status_code, ttfb=ttfb)
+
+                body = bytearray()
+                truncated = False
+                async for chunk in response.aiter_bytes():
+                    body.extend(chunk)
+                    if len(body) >= FETCH_MAX_BYTES:
+                        truncated = True
+                        del body[FETCH_MAX_BYTES:]
+                        break
+
+                text = decode_html(bytes(body), response.charset_encoding)
+                logger.debug(
+                    f"Fetched {url}: {len(body)} bytes, ttfb={ttfb:.3f}s, "
+                    f"total={time.monotonic() - started:.3f}s{' (truncated)' if truncated else ''}"
+                )
+                return FetchResult(
+                    status_code=response.status_code,
+                    text=text,
+                    etag=response.headers.get("etag"),
+                    last_modified=response.headers.get("last-modified"),
+                    bytes_read=len(body),
+                    ttfb=ttfb,
+                    truncated=truncated,
+                )
         except Exception as e:
             logger.error(f"Error fetching URL {url}: {e}")
-            return ""
+            return FetchResult()
 
 
+@metrics.timed("company_info")
 async def search_with_yandex(query: str, url: str = None) -> Dict[str, Any]:
     """Placeholder function that returns basic company info without using Yandex API
     
@@ -196,59 +680,177 @@ async def search_with_yandex(query: str, url: str = None) -> Dict[str, Any]:
     }
 
 
+def start_extractor_pool() -> None:
+    """Create the process pool used by clean_html_content"""
+    global _extractor_pool
+    if _extractor_pool is not None or EXTRACTOR_PROCESSES <= 0:
+        return
+    # spawn: дочерние процессы не наследуют event loop и открытые соединения
+    _extractor_pool = ProcessPoolExecutor(
+        max_workers=EXTRACTOR_PROCESSES,
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+    logger.info(f"HTML extractor pool started ({EXTRACTOR_PROCESSES} processes, backend={extractor_backend})")
+
+
+def shutdown_extractor_pool() -> None:
+    global _extractor_pool
+    if _extractor_pool is not None:
+        _extractor_pool.shutdown(wait=False, cancel_futures=True)
+        _extractor_pool = None
+
+
+async def _run_extractor(func: Callable[[str, str], Any], html_content: str) -> Any:
+    """Run an extractors.* function with the configured backend, in the pool for large pages"""
+    try:
+        # Небольшие страницы дешевле разобрать на месте, чем передавать в другой процесс;
+        # порог в байтах, а кириллический символ занимает два (символов не больше, чем байт)
+        if _extractor_pool is None or (
+            len(html_content) <= EXTRACTOR_INLINE_MAX_BYTES
+            and len(html_content.encode("utf-8")) <= EXTRACTOR_INLINE_MAX_BYTES
+        ):
+            return func(html_content, extractor_backend)
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_extractor_pool, func, html_content, extractor_backend)
+    except Exception as e:
+        if extractor_backend == "bs4":
+            raise
+        logger.error(f"{extractor_backend} extractor failed ({e}), falling back to bs4")
+        return await asyncio.to_thread(func, html_content, "bs4")
+
+
+@metrics.timed("clean_html")
 async def clean_html_content(html_content: str) -> str:
     if not html_content:
         return ""
+    return await _run_extractor(extract_text, html_content)
+
 
-    soup = BeautifulSoup(html_content, 'html.parser')
-    for script in soup(["script", "style"]):
-        script.decompose()
+@metrics.timed("clean_html")
+async def extract_page_content(html_content: str) -> Tuple[str, List[Tuple[str, str]]]:
+    """Cleaned text and (href, anchor text) links of a page, parsed off the event loop"""
+    if not html_content:
+        return "", []
+    return await _run_extractor(extract_page, html_content)
 
-    text = soup.get_text()
-    lines = (line.strip() for line in text.splitlines())
-    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-    return ' '.join(chunk for chunk in chunks if chunk)
 
+# Callback for streamed generation; receives the accumulated text so far
+DeltaCallback = Callable[[str], Awaitable[None]]
 
-async def generate_ai_description(cleaned_text: str) -> str:
-    # Ensure cleaned_text is a string
-    if cleaned_text is None:
-        cleaned_text = ""
-    if not isinstance(cleaned_text, str):
-        cleaned_text = str(cleaned_text)
-    
-    # Extract Yandex company info if available
-    company_info = {}
+
+def content_hash(*parts: str) -> str:
+    """sha256 over the given strings, used as a cache key"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update((part or "").encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def site_content_hash(cleaned_text: str, company_info: Optional[Dict[str, Any]] = None) -> str:
+    """Hash identifying the site context an answer was generated from"""
+    return content_hash(cleaned_text, json.dumps(company_info or {}, ensure_ascii=False, sort_keys=True))
+
+
+def description_key(site_hash: str) -> str:
+    """Key of a site description in the description cache tiers"""
+    return content_hash(DESCRIPTION_PROMPT_VERSION, OPENAI_MODEL, site_hash)
+
+
+def description_cache_stats() -> Dict[str, Any]:
+    """Hit/miss counters of both description cache tiers"""
+    return {"memory": description_cache.stats(), "database": dict(description_db_stats)}
+
+
+def normalize_question(question: str) -> str:
+    """Normalize a question for cache lookups: case, punctuation, whitespace, endings"""
+    return " ".join(tokenize(question))
+
+
+def invalidate_answers(site_hash: str) -> int:
+    """Drop cached answers computed for the site content with the given hash"""
+    return answer_cache.discard_where(lambda key: key[0] == site_hash)
+
+
+@metrics.timed("answer")
+async def get_question_answer(
+    cleaned_text: str,
+    question: str,
+    on_delta: Optional[DeltaCallback] = None,
+    index: Optional[Dict[str, Any]] = None,
+    company_info: Optional[Dict[str, Any]] = None,
+    site_hash: Optional[str] = None,
+) -> str:
+    """Cached generate_ai_question_answer; a hit skips the LLM entirely
+
+    index is the parsed page index kept in ChatContext. site_hash is the stored
+    Site.content_hash; it is computed from the content when omitted.
+    """
+    normalized = normalize_question(question)
+    if not normalized:
+        return await generate_ai_question_answer(cleaned_text, question, on_delta, index, company_info)
+
+    key = (site_hash or site_content_hash(cleaned_text, company_info), normalized)
+    answer = answer_cache.get(key)
+    if answer is not None:
+        logger.debug(f"Answer cache hit for '{normalized}'")
+        return answer
+
+    answer = await generate_ai_question_answer(cleaned_text, question, on_delta, index, company_info)
+    if answer and answer != OPENAI_ERROR_RESPONSE:
+        answer_cache.set(key, answer)
+    return answer
+
+
+@metrics.timed("description")
+async def get_company_description(
+    db: AsyncSession,
+    cleaned_text: str,
+    on_delta: Optional[DeltaCallback] = None,
+    company_info: Optional[Dict[str, Any]] = None,
+    site_hash: Optional[str] = None,
+) -> str:
+    """Memoized generate_ai_description keyed by a hash of the content and prompt version"""
+    key = description_key(site_hash or site_content_hash(cleaned_text, company_info))
+
+    description = description_cache.get(key)
+    if description is not None:
+        logger.debug(f"Description cache hit (memory) for {key[:12]}")
+        return description
+
+    record = await db.get(DescriptionCache, key)
+    # Завершаем транзакцию, чтобы не держать соединение из пула во время вызова LLM
+    await db.commit()
+    if record is not None:
+        description_db_stats["hits"] += 1
+        logger.debug(f"Description cache hit (database) for {key[:12]}")
+        description_cache.set(key, record.description)
+        return record.description
+    description_db_stats["misses"] += 1
+
+    description = await generate_ai_description(cleaned_text, on_delta, company_info)
+    if not description or description == OPENAI_ERROR_RESPONSE:
+        return description
+
+    description_cache.set(key, description)
+    db.add(DescriptionCache(content_hash=key, description=description))
     try:
-        yandex_info_match = re.search(r'YANDEX_COMPANY_INFO: (\{.*\})', cleaned_text, re.DOTALL)
-        if yandex_info_match:
-            try:
-                company_info = json.loads(yandex_info_match.group(1))
-                # Remove the Yandex info from cleaned text to avoid duplication
-                cleaned_text = cleaned_text.replace(yandex_info_match.group(0), "")
-            except json.JSONDecodeError:
-                pass
-    except Exception as e:
-        logger.error(f"Error extracting company info in description: {e}")
-        # Continue with empty company_info if there's an error
-    
-    company_name = company_info.get("company_name", "")
-    if company_name == "Unknown":
-        company_name = ""
-        
-    company_description = company_info.get("description", "")
-    company_services = company_info.get("services", [])
-    
-    prompt = f"""
+        await db.commit()
+    except IntegrityError:
+        # То же описание уже сохранено параллельно
+        await db.rollback()
+    return description
+
+
+DESCRIPTION_PROMPT = """
 Роль:
 ТЫ — AI-консультант компании, который общается в дружелюбном, естественном стиле.
 
-Контекст: "{cleaned_text}"
+Контекст: "{context}"
 
 Дополнительная информация о компании:
-Название: {company_name}
-Описание: {company_description}
-Услуги: {', '.join(company_services) if isinstance(company_services, list) else company_services}
+{company_info}
 
 Твоя задача:
 1. Представиться как AI-консультант компании в дружелюбной манере
@@ -272,56 +874,17 @@ async def generate_ai_description(cleaned_text: str) -> str:
 
 Если контекст пустой или информации недостаточно, сообщи что нужна ссылка на сайт компании через /start example.com
 """
-    return await generate_openai_response(prompt)
-
 
-async def generate_ai_question_answer(cleaned_text: str, question: str) -> str:
-    # Ensure cleaned_text is a string
-    if cleaned_text is None:
-        cleaned_text = ""
-    if not isinstance(cleaned_text, str):
-        cleaned_text = str(cleaned_text)
-        
-    # Ensure question is a string
-    if question is None:
-        question = ""
-    if not isinstance(question, str):
-        question = str(question)
-    
-    # Extract Yandex company info if available
-    company_info = {}
-    try:
-        yandex_info_match = re.search(r'YANDEX_COMPANY_INFO: (\{.*\})', cleaned_text, re.DOTALL)
-        if yandex_info_match:
-            try:
-                company_info = json.loads(yandex_info_match.group(1))
-                # Remove the Yandex info from cleaned text to avoid duplication
-                cleaned_text = cleaned_text.replace(yandex_info_match.group(0), "")
-            except json.JSONDecodeError:
-                pass
-    except Exception as e:
-        logger.error(f"Error extracting company info: {e}")
-        # Continue with empty company_info if there's an error
-    
-    company_name = company_info.get("company_name", "")
-    if company_name == "Unknown":
-        company_name = ""
-        
-    company_description = company_info.get("description", "")
-    company_services = company_info.get("services", [])
-    
-    prompt = f"""
+QUESTION_PROMPT = """
     Роль:
-    ТЫ — дружелюбный AI-консультант компании {company_name if company_name else "(название из контекста)"}
+    ТЫ — дружелюбный AI-консультант компании {company_name}
     Твоя задача отвечать ТОЛЬКО на вопросы, связанные с компанией, ее услугами и продуктами.
 
     Контекст о компании:
-    {cleaned_text}
+    {context}
 
     Дополнительная информация о компании:
-    Название: {company_name}
-    Описание: {company_description}
-    Услуги: {', '.join(company_services) if isinstance(company_services, list) else company_services}
+    {company_info}
 
     Вопрос: {question}
 
@@ -340,21 +903,99 @@ async def generate_ai_question_answer(cleaned_text: str, question: str) -> str:
 
 Вместо формального: "Компания предоставляет следующие услуги..."
     """
-    return await generate_openai_response(prompt)
 
 
-async def generate_openai_response(prompt: str) -> str:
-    if not openai_client:
-        return "Сервис временно недоступен."
+def _format_company_info(company_info: Dict[str, Any], company_name: str) -> str:
+    company_description = company_info.get("description", "")
+    company_services = company_info.get("services", [])
+    services = ', '.join(company_services) if isinstance(company_services, list) else company_services
+    return f"Название: {company_name}\nОписание: {company_description}\nУслуги: {services}"
 
+
+async def generate_ai_description(
+    cleaned_text: str,
+    on_delta: Optional[DeltaCallback] = None,
+    company_info: Optional[Dict[str, Any]] = None,
+) -> str:
+    # Ensure cleaned_text is a string
+    if cleaned_text is None:
+        cleaned_text = ""
+    if not isinstance(cleaned_text, str):
+        cleaned_text = str(cleaned_text)
+    
+    company_info = company_info or {}
+    company_name = company_info.get("company_name", "")
+    if company_name == "Unknown":
+        company_name = ""
+        
+    prompt = build_prompt(
+        "description",
+        DESCRIPTION_PROMPT,
+        [
+            Section("context", PROMPT_CONTEXT_TOKENS, text=cleaned_text),
+            Section("company_info", PROMPT_COMPANY_INFO_TOKENS, text=_format_company_info(company_info, company_name)),
+        ],
+    )
+    return await generate_openai_response(prompt, on_delta)
+
+
+async def generate_ai_question_answer(
+    cleaned_text: str,
+    question: str,
+    on_delta: Optional[DeltaCallback] = None,
+    index: Optional[Dict[str, Any]] = None,
+    company_info: Optional[Dict[str, Any]] = None,
+) -> str:
+    # Ensure cleaned_text is a string
+    if cleaned_text is None:
+        cleaned_text = ""
+    if not isinstance(cleaned_text, str):
+        cleaned_text = str(cleaned_text)
+        
+    # Ensure question is a string
+    if question is None:
+        question = ""
+    if not isinstance(question, str):
+        question = str(question)
+    
+    company_info = company_info or {}
+    company_name = company_info.get("company_name", "")
+    if company_name == "Unknown":
+        company_name = ""
+        
+    # Only the passages relevant to the question go into the prompt, most relevant first
+    if RETRIEVAL_ENABLED and index is not None:
+        passages = search_ranked(index, question, top_k=RETRIEVAL_TOP_K)
+        logger.debug(f"Retrieved {len(passages)} of {len(index['chunks'])} passages for the question")
+        context = Section("context", PROMPT_CONTEXT_TOKENS, passages=passages)
+    else:
+        context = Section("context", PROMPT_CONTEXT_TOKENS, text=cleaned_text)
+
+    prompt = build_prompt(
+        "question",
+        QUESTION_PROMPT,
+        [
+            context,
+            Section("company_info", PROMPT_COMPANY_INFO_TOKENS, text=_format_company_info(company_info, company_name)),
+            Section("question", PROMPT_QUESTION_TOKENS, text=question),
+        ],
+        company_name=company_name if company_name else "(название из контекста)",
+    )
+    return await generate_openai_response(prompt, on_delta)
+
+
+@metrics.timed("llm")
+async def generate_openai_response(prompt: str, on_delta: Optional[DeltaCallback] = None) -> str:
     try:
-        completion = openai_client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "user", "content": prompt}
-            ]
-        )
-        return completion.choices[0].message.content
+        if on_delta is None:
+            return await LLMClient.complete(prompt)
+
+        # Потоковая генерация: передаем накопленный текст по мере поступления токенов
+        text = ""
+        async for delta in LLMClient.stream(prompt):
+            text += delta
+            await on_delta(text)
+        return text
     except Exception as e:
         logger.error(f"OpenAI error: {e}")
-        return "Ошибка генерации ответа."
\ No newline at end of file
+        return OPENAI_ERROR_RESPONSE
\ No newline at end of file
@@ -1,110 +1,347 @@
 import httpx
 import logging
-from typing import Optional, Dict, Any, List
-from config import TELEGRAM_BOT_TOKEN
+import time
+from typing import Optional, Dict, Any, List, Callable, Awaitable
+from config import (
+    TELEGRAM_BOT_TOKEN,
+    TELEGRAM_API_URL,
+    TELEGRAM_EDIT_INTERVAL,
+    STREAMING_ENABLED,
+    TELEGRAM_MAX_CONNECTIONS,
+    TELEGRAM_MAX_KEEPALIVE_CONNECTIONS,
+    TELEGRAM_KEEPALIVE_EXPIRY,
+    TELEGRAM_HTTP2,
+    WEBHOOK_URL,
+    WEBHOOK_SECRET,
+    WEBHOOK_MAX_CONNECTIONS,
+)
+from rate_limiter import SendScheduler, PRIORITY_HIGH, PRIORITY_NORMAL
+import metrics
 
 logger = logging.getLogger(__name__)
 
 class TelegramClient:
-    API_URL = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}"
+    API_URL = f"{TELEGRAM_API_URL}/bot{TELEGRAM_BOT_TOKEN}"
     # Для хранения последнего полученного update_id
     last_update_id = 0
-    
+
+    # Общий пул соединений, переиспользуется всеми вызовами API
+    _client: Optional[httpx.AsyncClient] = None
+    _stats = {"requests": 0, "connections_opened": 0}
+    # Очередь исходящих сообщений с ограничением частоты
+    _scheduler: Optional[SendScheduler] = None
+
+    @classmethod
+    async def startup(cls) -> None:
+        """Create the shared HTTP client used for all Telegram API calls"""
+        if cls._client is not None:
+            return
+
+        http2 = TELEGRAM_HTTP2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning("TELEGRAM_HTTP2 is enabled but the h2 package is not installed, using HTTP/1.1")
+                http2 = False
+
+        limits = httpx.Limits(
+            max_connections=TELEGRAM_MAX_CONNECTIONS,
+            max_keepalive_connections=TELEGRAM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=TELEGRAM_KEEPALIVE_EXPIRY,
+        )
+        cls._client = httpx.AsyncClient(limits=limits, http2=http2, timeout=10.0)
+        cls._scheduler = SendScheduler()
+        cls._scheduler.start()
+        logger.info(
+            f"Telegram HTTP client started (max_connections={TELEGRAM_MAX_CONNECTIONS}, "
+            f"keepalive={TELEGRAM_MAX_KEEPALIVE_CONNECTIONS}, http2={http2})"
+        )
+
+    @classmethod
+    async def shutdown(cls, timeout: float = 10.0) -> None:
+        """Send queued messages, then close the shared HTTP client and release pooled connections"""
+        if cls._scheduler is not None:
+            await cls._scheduler.close(timeout)
+            logger.info(f"Send scheduler stats: {cls._scheduler.stats()}")
+            cls._scheduler = None
+        if cls._client is None:
+            return
+
+        logger.info(f"Closing Telegram HTTP client, pool stats: {cls.pool_stats()}")
+        await cls._client.aclose()
+        cls._client = None
+
+    @classmethod
+    def pool_stats(cls) -> Dict[str, Any]:
+        """Return request/connection counters and the current state of the pool"""
+        stats = dict(cls._stats)
+        stats["open_connections"] = 0
+        stats["idle_connections"] = 0
+
+        # httpx не предоставляет публичного API для пула, поэтому читаем его аккуратно
+        pool = getattr(getattr(cls._client, "_transport", None), "_pool", None)
+        for connection in getattr(pool, "connections", []):
+            stats["open_connections"] += 1
+            if connection.is_idle():
+                stats["idle_connections"] += 1
+
+        if stats["requests"]:
+            stats["reuse_ratio"] = round(1 - stats["connections_opened"] / stats["requests"], 3)
+        return stats
+
+    @classmethod
+    async def _trace(cls, event_name: str, info: Dict[str, Any]) -> None:
+        if event_name == "connection.connect_tcp.complete":
+            cls._stats["connections_opened"] += 1
+
+    @classmethod
+    async def _request(cls, method: str, endpoint: str, **kwargs) -> httpx.Response:
+        if cls._client is None:
+            await cls.startup()
+
+        cls._stats["requests"] += 1
+        return await cls._client.request(
+            method,
+            f"{cls.API_URL}/{endpoint}",
+            extensions={"trace": cls._trace},
+            **kwargs,
+        )
+
+    @classmethod
+    def send_stats(cls) -> Dict[str, Any]:
+        """Outbound queue depth, wait times and drop counters"""
+        return cls._scheduler.stats() if cls._scheduler is not None else {}
+
+    @classmethod
+    @metrics.timed("telegram_send")
+    async def _send(
+        cls, chat_id: int, endpoint: str, data: Dict[str, Any], priority: int, retries: Optional[int] = None
+    ) -> Dict[str, Any]:
+        if cls._scheduler is None:
+            await cls.startup()
+
+        async def call() -> Dict[str, Any]:
+            response = await cls._request("POST", endpoint, json=data)
+            return response.json()
+
+        return await cls._scheduler.submit(chat_id, call, priority=priority, retries=retries)
+
     @classmethod
-    async def send_message(cls, chat_id: int, text: str) -> Dict[str, Any]:
-        """Send a message to a chat via Telegram API"""
-        url = f"{cls.API_URL}/sendMessage"
-        
+    async def send_message(cls, chat_id: int, text: str, priority: int = PRIORITY_HIGH) -> Dict[str, Any]:
+        """Send a message to a chat via Telegram API
+
+        The message goes through the rate-limited send queue; higher priority
+        messages (lower value) are sent first.
+        """
         data = {
             "chat_id": chat_id,
             "text": text,
             "parse_mode": "HTML",
         }
-        
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, json=data)
-            return response.json()
-    
+
+        result = await cls._send(chat_id, "sendMessage", data, priority)
+        if not result.get("ok"):
+            logger.error(f"sendMessage to chat {chat_id} failed: {result.get('description')}")
+        return result
+
+    @classmethod
+    async def edit_message_text(
+        cls,
+        chat_id: int,
+        message_id: int,
+        text: str,
+        parse_mode: Optional[str] = "HTML",
+        priority: int = PRIORITY_HIGH,
+        retries: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """Replace the text of a previously sent message"""
+        data = {
+            "chat_id": chat_id,
+            "message_id": message_id,
+            "text": text,
+        }
+        if parse_mode:
+            data["parse_mode"] = parse_mode
+
+        return await cls._send(chat_id, "editMessageText", data, priority, retries)
+
     @classmethod
     async def get_webhook_info(cls) -> Dict[str, Any]:
         """Get information about the current webhook"""
-        url = f"{cls.API_URL}/getWebhookInfo"
-        
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url)
-            return response.json()
-    
+        response = await cls._request("GET", "getWebhookInfo")
+        return response.json()
+
     @classmethod
-    async def set_webhook(cls) -> Dict[str, Any]:
-        """Set the webhook for the Telegram bot"""
-        url = f"{cls.API_URL}/setWebhook"
-        
-        # Логируем точный URL для отладки
-        webhook_url = WEBHOOK_URL.strip()
+    async def set_webhook(
+        cls,
+        url: str = WEBHOOK_URL,
+        secret_token: str = WEBHOOK_SECRET,
+        max_connections: int = WEBHOOK_MAX_CONNECTIONS,
+    ) -> Dict[str, Any]:
+        """Set the webhook for the Telegram bot
+
+        Telegram sends secret_token back in the X-Telegram-Bot-Api-Secret-Token
+        header of every webhook request.
+        """
+        webhook_url = url.strip()
         logger.debug(f"Setting webhook with URL: '{webhook_url}'")
-        logger.debug(f"WEBHOOK_URL from env: '{WEBHOOK_URL}'")
-        logger.debug(f"Environment type: {type(WEBHOOK_URL)}")
-        
+
         data = {
             "url": webhook_url,
-            "allowed_updates": ["message"]
+            "allowed_updates": ["message"],
+            "max_connections": max_connections,
         }
-        
+        if secret_token:
+            data["secret_token"] = secret_token
+
         try:
-            async with httpx.AsyncClient() as client:
-                logger.debug(f"Sending webhook config: {data}")
-                response = await client.post(url, json=data)
-                result = response.json()
-                logger.debug(f"Webhook response: {result}")
-                return result
+            response = await cls._request("POST", "setWebhook", json=data)
+            result = response.json()
+            logger.debug(f"Webhook response: {result}")
+            return result
         except Exception as e:
             logger.error(f"Error setting webhook: {e}")
             raise
-    
+
     @classmethod
     async def delete_webhook(cls) -> Dict[str, Any]:
         """Delete the webhook for the Telegram bot"""
-        url = f"{cls.API_URL}/deleteWebhook"
-        
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url)
-            return response.json()
-    
+        response = await cls._request("POST", "deleteWebhook")
+        return response.json()
+
     @classmethod
-    async def get_updates(cls, timeout: int = 30) -> List[Dict[str, Any]]:
+    async def get_updates(cls, timeout: int = 30, limit: int = 100) -> List[Dict[str, Any]]:
         """Get updates from Telegram API using long polling
-        
+
         Args:
             timeout: Timeout in seconds for long polling
-            
+            limit: Maximum number of updates to fetch (1-100)
+
         Returns:
             List of update objects
+
+        Raises:
+            httpx.HTTPError: If the request fails
+            RuntimeError: If Telegram returns an error response
         """
-        url = f"{cls.API_URL}/getUpdates"
-        
         params = {
             "timeout": timeout,
+            "limit": max(1, min(limit, 100)),
             "allowed_updates": ["message"],
         }
-        
+
         # Если у нас уже есть last_update_id, запрашиваем только новые сообщения
         if cls.last_update_id > 0:
             params["offset"] = cls.last_update_id + 1
-        
+
+        response = await cls._request("GET", "getUpdates", params=params, timeout=timeout+10)
+        result = response.json()
+
+        if not result.get("ok"):
+            raise RuntimeError(f"getUpdates failed: {result.get('description', response.status_code)}")
+
+        updates = result.get("result") or []
+
+        # Обновляем last_update_id
+        if updates:
+            cls.last_update_id = max(update["update_id"] for update in updates)
+
+        return updates
+
+
+# Максимальная длина текста сообщения в Telegram
+MAX_MESSAGE_LENGTH = 4096
+
+
+class ProgressiveMessage:
+    """Delivers a streamed answer by editing a single placeholder message.
+
+    Edits are throttled to one per TELEGRAM_EDIT_INTERVAL seconds (and pushed
+    back further when Telegram answers with retry_after). With streaming
+    disabled nothing is sent until finish(), which sends the text once.
+    """
+
+    PLACEHOLDER = "⏳ Готовлю ответ..."
+
+    def __init__(self, chat_id: int, streaming: bool = STREAMING_ENABLED, interval: float = TELEGRAM_EDIT_INTERVAL):
+        self.chat_id = chat_id
+        self.streaming = streaming
+        self.interval = interval
+        self.message_id: Optional[int] = None
+        self.edits = 0
+        self._last_text = ""
+        self._next_edit_at = 0.0
+
+    @property
+    def on_delta(self) -> Optional[Callable[[str], Awaitable[None]]]:
+        """Callback for streamed generation, or None when streaming is disabled"""
+        return self.update if self.streaming else None
+
+    async def start(self) -> None:
+        """Send the placeholder message"""
+        if not self.streaming or self.message_id is not None:
+            return
         try:
-            async with httpx.AsyncClient(timeout=timeout+10) as client:
-                response = await client.get(url, params=params)
-                result = response.json()
-                
-                if result.get("ok") and result.get("result"):
-                    updates = result["result"]
-                    
-                    # Обновляем last_update_id
-                    if updates:
-                        cls.last_update_id = max(update["update_id"] for update in updates)
-                    
-                    return updates
-                return []
+            result = await TelegramClient.send_message(self.chat_id, self.PLACEHOLDER, priority=PRIORITY_NORMAL)
+            self.message_id = (result.get("result") or {}).get("message_id")
+            self._next_edit_at = time.monotonic() + self.interval
         except Exception as e:
-            logger.error(f"Error getting updates: {e}")
-            return []
\ No newline at end of file
+            logger.error(f"Error sending placeholder message: {e}")
+
+    async def _edit(self, text: str, parse_mode: Optional[str], final: bool = True) -> Dict[str, Any]:
+        # Промежуточные правки уступают ответам и не повторяются: следующая все равно новее
+        result = await TelegramClient.edit_message_text(
+            self.chat_id,
+            self.message_id,
+            text,
+            parse_mode=parse_mode,
+            priority=PRIORITY_HIGH if final else PRIORITY_NORMAL,
+            retries=None if final else 0,
+        )
+        self.edits += 1
+        self._next_edit_at = time.monotonic() + self.interval
+        if result.get("ok"):
+            self._last_text = text
+            return result
+
+        retry_after = (result.get("parameters") or {}).get("retry_after")
+        if retry_after:
+            self._next_edit_at = time.monotonic() + retry_after
+        logger.debug(f"editMessageText failed: {result.get('description')}")
+        return result
+
+    async def update(self, text: str) -> None:
+        """Show the partial text if the throttle interval has passed"""
+        if self.message_id is None or time.monotonic() < self._next_edit_at:
+            return
+
+        # Промежуточный текст может содержать незакрытые HTML-теги, поэтому без parse_mode
+        partial = text[:MAX_MESSAGE_LENGTH]
+        if not partial.strip() or partial == self._last_text:
+            return
+        try:
+            await self._edit(partial, parse_mode=None, final=False)
+        except Exception as e:
+            logger.error(f"Error updating streamed message: {e}")
+
+    async def finish(self, text: str) -> None:
+        """Deliver the final text: edit the placeholder or send a new message"""
+        if self.message_id is None:
+            await TelegramClient.send_message(self.chat_id, text)
+            return
+
+        head, tail = text[:MAX_MESSAGE_LENGTH], text[MAX_MESSAGE_LENGTH:]
+        try:
+            # Повторы после 429 выполняет очередь отправки
+            result = await self._edit(head, parse_mode="HTML")
+            if not result.get("ok"):
+                # HTML не разобрался - оставляем текст без форматирования
+                await self._edit(head, parse_mode=None)
+        except Exception as e:
+            logger.error(f"Error finalizing streamed message: {e}")
+            await TelegramClient.send_message(self.chat_id, text)
+            return
+
+        if tail:
+            await TelegramClient.send_message(self.chat_id, tail)
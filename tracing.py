@@ -0,0 +1,272 @@
+"""
+Per-update trace spans.
+
+handle_update opens a trace for every sampled update; the trace id travels in
+a context variable through services, so pipeline stages (metrics.timed) and
+SQL statements become child spans without passing anything around. A finished
+trace is written as one JSON log line or sent to an OpenTelemetry collector
+over OTLP/HTTP (JSON encoding), so no OpenTelemetry SDK is required.
+"""
+
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import random
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+from config import (
+    TRACING_ENABLED,
+    TRACE_SAMPLE_RATE,
+    TRACE_EXPORTER,
+    TRACE_OTLP_ENDPOINT,
+    TRACE_SERVICE_NAME,
+)
+
+logger = logging.getLogger(__name__)
+
+enabled = TRACING_ENABLED
+
+EXPORT_BATCH_SIZE = 64
+EXPORT_INTERVAL = 2.0
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    start_ns: int
+    end_ns: int = 0
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+    # Все завершенные спаны трассы, общий список у корня и потомков
+    finished: List["Span"] = field(default_factory=list, repr=False)
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6
+
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+_export_queue: Optional[asyncio.Queue] = None
+_export_task: Optional[asyncio.Task] = None
+_export_client = None
+stats = {"traces": 0, "spans": 0, "exported": 0, "export_errors": 0, "dropped": 0}
+
+
+def _new_id(size: int) -> str:
+    return os.urandom(size).hex()
+
+
+def current_trace_id() -> Optional[str]:
+    span = _current_span.get()
+    return span.trace_id if span is not None else None
+
+
+@contextmanager
+def start_trace(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """Root span of an update; sampled by TRACE_SAMPLE_RATE"""
+    if not enabled or random.random() >= TRACE_SAMPLE_RATE:
+        yield None
+        return
+
+    root = Span(name, _new_id(16), _new_id(8), None, time.time_ns(), attributes=attributes)
+    token = _current_span.set(root)
+    try:
+        yield root
+    except BaseException as e:
+        root.error = repr(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        root.end_ns = time.time_ns()
+        root.finished.append(root)
+        stats["traces"] += 1
+        stats["spans"] += len(root.finished)
+        _export(root)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """Child span of the current trace; does nothing outside a trace"""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+
+    child = Span(
+        name, parent.trace_id, _new_id(8), parent.span_id, time.time_ns(),
+        attributes=attributes, finished=parent.finished,
+    )
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.error = repr(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        child.end_ns = time.time_ns()
+        child.finished.append(child)
+
+
+class TraceIdFilter(logging.Filter):
+    """Adds trace_id to log records so log lines of one update can be grouped"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = current_trace_id() or "-"
+        return True
+
+
+def instrument_engine(engine: Any) -> None:
+    """Record every SQL statement of a (sync) SQLAlchemy engine as a db_query span"""
+    if not enabled:
+        return
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        manager = span("db_query", statement=statement[:200])
+        manager.__enter__()
+        conn.info.setdefault("trace_spans", []).append(manager)
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info["trace_spans"].pop().__exit__(None, None, None)
+
+    @event.listens_for(engine, "handle_error")
+    def on_error(context):
+        spans = context.connection.info.get("trace_spans") if context.connection is not None else None
+        if spans:
+            error = context.original_exception
+            spans.pop().__exit__(type(error), error, error.__traceback__)
+
+
+def _to_json(root: Span) -> Dict[str, Any]:
+    return {
+        "trace_id": root.trace_id,
+        "name": root.name,
+        "duration_ms": round(root.duration_ms, 1),
+        "attributes": root.attributes,
+        "error": root.error,
+        "spans": [
+            {
+                "name": s.name,
+                "span_id": s.span_id,
+                "parent_id": s.parent_id,
+                "offset_ms": round((s.start_ns - root.start_ns) / 1e6, 1),
+                "duration_ms": round(s.duration_ms, 1),
+                **({"attributes": s.attributes} if s.attributes else {}),
+                **({"error": s.error} if s.error else {}),
+            }
+            for s in sorted(root.finished, key=lambda s: s.start_ns)
+            if s is not root
+        ],
+    }
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _to_otlp(s: Span) -> Dict[str, Any]:
+    otlp = {
+        "traceId": s.trace_id,
+        "spanId": s.span_id,
+        "name": s.name,
+        "kind": 2 if s.parent_id is None else 1,
+        "startTimeUnixNano": str(s.start_ns),
+        "endTimeUnixNano": str(s.end_ns),
+        "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items()],
+        "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+    }
+    if s.parent_id:
+        otlp["parentSpanId"] = s.parent_id
+    return otlp
+
+
+def _export(root: Span) -> None:
+    if TRACE_EXPORTER != "otlp":
+        logger.info(json.dumps(_to_json(root), ensure_ascii=False))
+        return
+    if _export_queue is None:
+        stats["dropped"] += 1
+        return
+    for s in root.finished:
+        try:
+            _export_queue.put_nowait(s)
+        except asyncio.QueueFull:
+            stats["dropped"] += 1
+
+
+async def _export_loop() -> None:
+    while True:
+        batch = [await _export_queue.get()]
+        deadline = time.monotonic() + EXPORT_INTERVAL
+        while len(batch) < EXPORT_BATCH_SIZE and time.monotonic() < deadline:
+            try:
+                batch.append(await asyncio.wait_for(_export_queue.get(), deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                break
+        await _send_batch(batch)
+
+
+async def _send_batch(batch: List[Span]) -> None:
+    payload = {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": TRACE_SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": "tracing"}, "spans": [_to_otlp(s) for s in batch]}],
+        }]
+    }
+    try:
+        response = await _export_client.post(TRACE_OTLP_ENDPOINT, json=payload)
+        response.raise_for_status()
+        stats["exported"] += len(batch)
+    except Exception as e:
+        stats["export_errors"] += 1
+        logger.warning(f"Trace export to {TRACE_OTLP_ENDPOINT} failed: {e}")
+
+
+async def start_exporter() -> None:
+    """Start the background OTLP exporter when TRACE_EXPORTER=otlp"""
+    global _export_queue, _export_task, _export_client
+    if not enabled or TRACE_EXPORTER != "otlp" or _export_task is not None:
+        return
+    import httpx
+
+    _export_queue = asyncio.Queue(maxsize=10000)
+    _export_client = httpx.AsyncClient(timeout=5.0)
+    _export_task = asyncio.create_task(_export_loop(), name="trace-exporter")
+    logger.info(f"Exporting traces to {TRACE_OTLP_ENDPOINT}")
+
+
+async def shutdown_exporter() -> None:
+    """Flush queued spans and stop the exporter"""
+    global _export_queue, _export_task, _export_client
+    if _export_task is None:
+        return
+    _export_task.cancel()
+    await asyncio.gather(_export_task, return_exceptions=True)
+
+    pending = []
+    while not _export_queue.empty():
+        pending.append(_export_queue.get_nowait())
+    for i in range(0, len(pending), EXPORT_BATCH_SIZE):
+        await _send_batch(pending[i:i + EXPORT_BATCH_SIZE])
+
+    await _export_client.aclose()
+    _export_queue = None
+    _export_task = None
+    _export_client = None
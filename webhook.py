@@ -0,0 +1,111 @@
+import asyncio
+import hmac
+import logging
+from typing import Any, Dict
+
+from fastapi import FastAPI, Request, Response
+
+from cache import LRUCache
+from config import WEBHOOK_SECRET, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """Receives Telegram updates over HTTP and feeds them into the update queue.
+
+    Each request is acknowledged as soon as the update is queued, so Telegram
+    never waits for processing. When the queue is full the request is answered
+    with 503 and Telegram redelivers the update later.
+    """
+
+    def __init__(
+        self,
+        queue: asyncio.Queue,
+        secret: str = WEBHOOK_SECRET,
+        host: str = WEBHOOK_HOST,
+        port: int = WEBHOOK_PORT,
+        path: str = WEBHOOK_PATH,
+    ):
+        self.queue = queue
+        self.secret = secret
+        self.host = host
+        self.port = port
+        self.path = path
+        self.updates_received = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.unauthorized = 0
+        # Telegram повторяет доставку, если не дождался ответа
+        self._seen_updates = LRUCache(maxsize=4096)
+        self.app = self._create_app()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return queue depth and request counters"""
+        return {
+            "queue_depth": self.queue.qsize(),
+            "queue_maxsize": self.queue.maxsize,
+            "updates_received": self.updates_received,
+            "duplicates": self.duplicates,
+            "rejected": self.rejected,
+            "unauthorized": self.unauthorized,
+        }
+
+    def _authorized(self, request: Request) -> bool:
+        token = request.headers.get(SECRET_HEADER, "")
+        return hmac.compare_digest(token.encode(), self.secret.encode())
+
+    def _create_app(self) -> FastAPI:
+        app = FastAPI(docs_url=None, redoc_url=None, openapi_url=None)
+
+        @app.post(self.path)
+        async def receive_update(request: Request) -> Response:
+            if not self._authorized(request):
+                self.unauthorized += 1
+                return Response(status_code=401)
+            try:
+                update = await request.json()
+            except ValueError:
+                return Response(status_code=400)
+            if not isinstance(update, dict):
+                return Response(status_code=400)
+
+            update_id = update.get("update_id")
+            if update_id is not None and self._seen_updates.get(update_id, count=False):
+                self.duplicates += 1
+                return Response(status_code=200)
+
+            try:
+                self.queue.put_nowait(update)
+            except asyncio.QueueFull:
+                self.rejected += 1
+                logger.warning(f"Update queue is full ({self.queue.qsize()}), asking Telegram to retry")
+                return Response(status_code=503, headers={"Retry-After": "1"})
+
+            if update_id is not None:
+                self._seen_updates.set(update_id, True)
+            self.updates_received += 1
+            return Response(status_code=200)
+
+        @app.get("/healthz")
+        async def healthz() -> Dict[str, Any]:
+            return {"ok": True, **self.stats()}
+
+        return app
+
+    async def run(self) -> None:
+        """Serve the webhook endpoint until the server is stopped"""
+        import uvicorn
+
+        config = uvicorn.Config(
+            self.app,
+            host=self.host,
+            port=self.port,
+            access_log=False,
+            log_level="warning",
+        )
+        server = uvicorn.Server(config)
+        logger.info(f"Webhook server listening on {self.host}:{self.port}{self.path}")
+        await server.serve()
@@ -0,0 +1,57 @@
+"""
+Post synthetic Telegram updates to a running webhook endpoint (BOT_MODE=webhook).
+
+Usage (from the repository root, with the same .env as the bot):
+    python webhook_client.py "example.com"                       # one message from chat 1
+    python webhook_client.py "Какие услуги?" --chat-id 42 -n 20  # 20 updates from chat 42
+    python webhook_client.py "Контакты" --url http://bot:8080/telegram/webhook
+
+Replies are sent by the bot to the real Telegram API, so use the chat id of a
+test account or point the bot at a fake API server.
+"""
+
+import argparse
+import itertools
+import time
+
+import httpx
+
+from config import WEBHOOK_SECRET, WEBHOOK_PORT, WEBHOOK_PATH
+from webhook import SECRET_HEADER
+
+_update_ids = itertools.count(int(time.time() * 1000))
+
+
+def make_update(chat_id: int, text: str) -> dict:
+    """A minimal "message" update as Telegram sends it"""
+    update_id = next(_update_ids)
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Test"},
+            "text": text,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("text", help="message text")
+    parser.add_argument("--chat-id", type=int, default=1)
+    parser.add_argument("-n", "--count", type=int, default=1, help="number of updates to post")
+    parser.add_argument("--url", default=f"http://127.0.0.1:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+    parser.add_argument("--secret", default=WEBHOOK_SECRET)
+    args = parser.parse_args()
+
+    with httpx.Client(headers={SECRET_HEADER: args.secret}) as client:
+        for _ in range(args.count):
+            started = time.perf_counter()
+            response = client.post(args.url, json=make_update(args.chat_id, args.text))
+            print(f"{response.status_code} in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()